@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Runs rewrap.benchmark from a checkout of the source; see that module."""
+
+from rewrap import benchmark
+
+
+if __name__ == "__main__":
+    benchmark.main()
@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Runs rewrap.bookfile from a checkout of the source; see that module."""
+
+from rewrap import bookfile
+
+
+if __name__ == "__main__":
+    bookfile.main()
@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Runs rewrap.rewrap from a checkout of the source; see that module."""
+
+from rewrap import rewrap
+
+
+if __name__ == "__main__":
+    rewrap.main()
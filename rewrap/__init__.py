@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+"""Matching and wrapping an edited text to the page and line breaks of its template.
+
+match_paras matches the paragraphs of the input to those of the template, wrap wraps them and
+rewrap does both in one pass. api is the interface for callers that process texts in memory, and
+batch, daemon and bookfile serve many books or jobs at once. The command line tools are the main
+function of each of these modules, and are run by the scripts of the same name in the top
+directory of the source, as python3 -m rewrap.MODULE, or as the commands installed with the
+package."""
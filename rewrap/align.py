@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""Sequence alignment for shards of interned tokens.
+
+matching_blocks uses Myers' O(ND) difference algorithm to find a longest common subsequence of
+two sequences, where N is the total length of the sequences and D is the number of insertions and
+deletions needed to turn one into the other. Unlike difflib.SequenceMatcher, whose worst case is
+roughly quadratic in N whatever the sequences, it is fast whenever the sequences are similar, which
+is the normal case for shards of a template and input paragraph. A cost budget bounds D so that
+very dissimilar shards are given up on rather than aligned slowly."""
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def matching_blocks(a, b, max_cost=None):
+    """Aligns sequences a and b and returns a list of matching blocks of the same form as
+    difflib.SequenceMatcher.get_matching_blocks, i.e. [(i, j, n), ...] where a[i:i + n] ==
+    b[j:j + n], ending with the dummy block (len(a), len(b), 0). Raises BudgetExceeded if more
+    than max_cost insertions and deletions would be needed."""
+    n, m = len(a), len(b)
+    #skip common prefix and suffix, which are frequently most of the shard
+    prefix = 0
+    while prefix < n and prefix < m and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < n - prefix and suffix < m - prefix and a[n - 1 - suffix] == b[m - 1 - suffix]:
+        suffix += 1
+    blocks = []
+    if prefix:
+        blocks.append((0, 0, prefix))
+    middle = _middle_blocks(a[prefix:n - suffix], b[prefix:m - suffix], max_cost)
+    blocks += [(i + prefix, j + prefix, size) for i, j, size in middle]
+    if suffix:
+        blocks.append((n - suffix, m - suffix, suffix))
+    #merge adjacent blocks
+    merged = []
+    for block in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == block[0] and (
+            merged[-1][1] + merged[-1][2] == block[1]):
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + block[2])
+        else:
+            merged.append(block)
+    merged.append((n, m, 0))
+    return merged
+
+
+def _middle_blocks(a, b, max_cost):
+    """Myers' greedy forward algorithm, keeping the furthest reaching x of each diagonal k = x - y
+    for each cost d so that the path can be traced back."""
+    n, m = len(a), len(b)
+    if not n or not m:
+        return []
+    max_d = n + m
+    if max_cost != None and max_cost < max_d:
+        max_d = max_cost
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    trace = []
+    for d in range(max_d + 1):
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, d, n, m)
+    raise BudgetExceeded()
+
+
+def _backtrack(trace, d_end, n, m):
+    """Walk back through trace from (n, m), collecting the diagonal runs as blocks."""
+    blocks = []
+    x, y = n, m
+    for d in range(d_end, -1, -1):
+        #trace[d] holds v[-d - 1 .. d + 1] as it was before step d
+        vd = trace[d]
+        base = d + 1
+        k = x - y
+        if d == 0:
+            prev_x = prev_y = start_x = 0
+        else:
+            if k == -d or (k != d and vd[base + k - 1] < vd[base + k + 1]):
+                #reached by a step down from diagonal k + 1
+                prev_k = k + 1
+                start_x = vd[base + prev_k]
+            else:
+                #reached by a step right from diagonal k - 1
+                prev_k = k - 1
+                start_x = vd[base + prev_k] + 1
+            prev_x = vd[base + prev_k]
+            prev_y = prev_x - prev_k
+        start_y = start_x - k
+        if x > start_x:
+            blocks.append((start_x, start_y, x - start_x))
+        x, y = prev_x, prev_y
+    blocks.reverse()
+    return blocks
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""Library interface to paragraph matching and wrapping, for callers that want to process texts in
+memory rather than run the command line tools on files.
+
+match and wrap take the template and input as strings and return a MatchResult or WrapResult. The
+messages and stats that the command line tools would print are collected in the Diagnostics object
+of the result rather than printed. rewrap does both in one pass, as rewrap.py does.
+
+The processing modules are only imported when first used, so importing this module is fast."""
+
+import io
+
+
+class ParaCountMismatch(ValueError):
+    """Raised by wrap when the template and input have different numbers of paragraphs."""
+
+    def __init__(self, t_count, i_count):
+        ValueError.__init__(self, "Number of paragraphs differs: template %d, input %d" % (
+                t_count, i_count))
+        self.t_count = t_count
+        self.i_count = i_count
+
+
+class Diagnostics:
+    """What happened while processing a text. log is the text that the command line tools would
+    have printed, messages is a list of the messages logged, each a dictionary of the same form as
+    a line of a --report file, and stats is a dictionary as returned by stats.Stats.as_dict."""
+
+    def __init__(self, logger):
+        import json
+        self.log = logger.output.getvalue()
+        self.messages = [json.loads(X) for X in logger.report.getvalue().splitlines()]
+        self.stats = logger.stats.as_dict()
+
+
+class MatchResult:
+    """The result of match. text is what match_paras.py would have written to the .paramatch file,
+    t_count and i_count are the numbers of template and input tokens it contains and rep_rate is
+    the percentage of them that came from the input."""
+
+    def __init__(self, text, t_count, i_count, diagnostics):
+        self.text = text
+        self.t_count = t_count
+        self.i_count = i_count
+        self.rep_rate = i_count * 100 // (t_count + i_count)
+        self.diagnostics = diagnostics
+
+
+class WrapResult:
+    """The result of wrap or rewrap. text is the wrapped input. For wrap, t_count and i_count are
+    the numbers of paragraphs; for rewrap they are as for MatchResult."""
+
+    def __init__(self, text, t_count, i_count, diagnostics):
+        self.text = text
+        self.t_count = t_count
+        self.i_count = i_count
+        self.diagnostics = diagnostics
+
+
+def _logger(level):
+    """A wrap.Logger that collects its output and report in memory for Diagnostics."""
+    from .wrap import Logger
+    return Logger(io.StringIO(), level, io.StringIO())
+
+
+def match(template_str, input_str, level="info"):
+    """Matches the paragraphs of input_str to those of template_str. Messages below level are not
+    collected. Returns a MatchResult."""
+    from .match_paras import match_strings
+    logger = _logger(level)
+    text, t_count, i_count = match_strings(template_str, input_str, logger)
+    return MatchResult(text, t_count, i_count, Diagnostics(logger))
+
+
+def wrap(template_str, input_str, level="info", jobs=1):
+    """Wraps input_str, whose paragraphs must correspond to those of template_str, such as the text
+    of a MatchResult. If jobs is greater than 1, paragraphs are wrapped in a pool of jobs processes.
+    Returns a WrapResult, or raises ParaCountMismatch."""
+    from .wrap import wrap_strings
+    logger = _logger(level)
+    text, t_count, i_count = wrap_strings(template_str, input_str, logger, jobs)
+    if text == None:
+        raise ParaCountMismatch(t_count, i_count)
+    return WrapResult(text, t_count, i_count, Diagnostics(logger))
+
+
+def rewrap(template_str, input_str, level="info", jobs=1):
+    """Matches and wraps input_str in one pass. Returns a WrapResult."""
+    from . import rewrap as rewrap_module
+    logger = _logger(level)
+    text, paramatch_string, t_count, i_count = rewrap_module.rewrap(
+        template_str, input_str, logger, jobs)
+    return WrapResult(text, t_count, i_count, Diagnostics(logger))
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""This program runs paragraph matching and wrapping for many books in one process, saving the
+interpreter start up and module loading that running match_paras.py and wrap.py separately for
+each book would cost.
+
+The books may be given either as a manifest file, with one book per line in the form:
+    template_file input_file
+where paths containing spaces are quoted as in a shell, relative paths are relative to the
+manifest's directory and lines starting with # are ignored, or as a directory whose subdirectories
+each contain a file named "template" and a file named "input" (the layout of the tests directory).
+
+Each book is processed by rewrap, so its input.paramatch.wrap file is written as usual, but its
+input.paramatch file is only written if requested. The messages for each book are printed in book
+order once it is done, and a summary with the timing and rep_rate of each book is written to the
+summary file."""
+
+import sys
+import os
+import io
+import time
+import argparse
+import shlex
+import multiprocessing
+import functools
+from . import match_paras
+from . import rewrap
+from . import wrap
+
+
+def read_manifest(filename):
+    """Reads a manifest file into a list of the form [(template_file, input_file), ...]. Raises
+    ValueError naming the line if a line is not a pair of paths."""
+    base = os.path.dirname(filename)
+    books = []
+    with open(filename, encoding="utf-8") as f:
+        for c, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"): continue
+            try:
+                fields = shlex.split(line)
+            except ValueError as e:
+                raise ValueError("%s:%d: %s" % (filename, c, e))
+            if len(fields) != 2:
+                raise ValueError("%s:%d: expected template_file input_file, found %d fields" % (
+                        filename, c, len(fields)))
+            t_filename, i_filename = fields
+            books.append((os.path.join(base, t_filename), os.path.join(base, i_filename)))
+    return books
+
+
+def find_books(dirname):
+    """Finds each subdirectory of dirname containing a template and an input file and returns a
+    list of the form [(template_file, input_file), ...] in name order."""
+    books = []
+    for d in sorted(os.listdir(dirname)):
+        t_filename = os.path.join(dirname, d, "template")
+        i_filename = os.path.join(dirname, d, "input")
+        if os.path.isfile(t_filename) and os.path.isfile(i_filename):
+            books.append((t_filename, i_filename))
+    return books
+
+
+def process_book(book, paramatch=False, level="info"):
+    """Process pool worker. Matches and wraps one book of the form (template_file, input_file).
+    Returns a dictionary describing the result."""
+    t_filename, i_filename = book
+    output = io.StringIO()
+    result = {"template": t_filename, "input": i_filename, "status": "ok",
+              "time": 0.0, "rep_rate": None}
+    try:
+        start_time = time.time()
+        t_count, i_count = rewrap.rewrap_files(t_filename, i_filename, paramatch,
+                                              wrap.Logger(output, level))
+        result["time"] = time.time() - start_time
+        result["rep_rate"] = match_paras.rep_rate(t_count, i_count)
+    except Exception as e:
+        result["status"] = "error: %s" % e
+    result["output"] = output.getvalue()
+    return result
+
+
+def report(results, summary_filename, start_time):
+    """Prints the messages of each of results, as returned by process_book, and writes the
+    summary file. Returns the number of books that failed."""
+    failures = 0
+    count = 0
+    with open(summary_filename, "w", encoding="utf-8") as summary:
+        summary.write("%-40s %8s %8s  %s\n" % ("input", "time_s", "rep_rate", "status"))
+        for r in results:
+            print("------------------------------")
+            print(r["input"])
+            print("==============================")
+            sys.stdout.write(r["output"])
+            count += 1
+            if r["status"] != "ok": failures += 1
+            rate = "-" if r["rep_rate"] == None else "%d%%" % r["rep_rate"]
+            summary.write("%-40s %8.3f %8s  %s\n" % (r["input"], r["time"], rate, r["status"]))
+        summary.write("%d books, %d failed, %.3fs elapsed\n" % (
+                count, failures, time.time() - start_time))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [--jobs N] [--summary FILE] [--paramatch] [--log-level LEVEL] "
+        "manifest_or_directory")
+    parser.add_argument("books", help="a manifest file or a directory of book directories")
+    parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), metavar="N",
+                        help="process books in a pool of N processes")
+    parser.add_argument("--summary", default="batch-summary.txt", metavar="FILE",
+                        help="file to write the summary to")
+    parser.add_argument("--paramatch", action="store_true",
+                        help="also write each book's paragraph matching output")
+    parser.add_argument("--log-level", choices=["debug", "info", "warning", "error"],
+                        default="info", help="only report messages of at least this level")
+    args = parser.parse_args()
+    if os.path.isdir(args.books):
+        books = find_books(args.books)
+    elif os.path.isfile(args.books):
+        try:
+            books = read_manifest(args.books)
+        except ValueError as e:
+            print("Bad manifest: %s" % e)
+            sys.exit(-1)
+    else:
+        print("Usage: %s manifest_or_directory" % sys.argv[0])
+        sys.exit(-1)
+    start_time = time.time()
+    worker = functools.partial(process_book, paramatch=args.paramatch, level=args.log_level)
+    jobs = min(args.jobs, len(books))
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            failures = report(pool.imap(worker, books), args.summary, start_time)
+    else:
+        failures = report((worker(X) for X in books), args.summary, start_time)
+    if failures:
+        sys.exit(-2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+
+"""This program benchmarks tokenise, match_paras and wrap on synthetic books.
+
+A book of the requested number of paragraphs is generated from the seed texts, by default the pg84
+templates in the tests directory. The seed paragraphs are broken into sentences and each generated
+paragraph is a random selection of sentences with some words replaced by invented ones, so that
+paragraphs are distinct as they are in a real book. The template is wrapped to the short, ragged
+lines of a scanned page, with a page marker every page_lines lines. The input is the same text
+rewrapped to 72 columns with controlled perturbations: paragraphs joined, split and moved, and
+words edited.
+
+Each phase is timed separately and the results are written as JSON. If a baseline results file
+is given, each phase is compared against it and those that have slowed by more than the threshold
+are reported, so that scaling regressions show up before they reach a real book."""
+
+import sys
+import os
+import time
+import json
+import random
+import argparse
+import io
+from . import tokenise
+from . import match_paras
+from . import wrap
+
+
+#the tests directory is beside the package, so the seeds are found from any directory
+tests_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests")
+default_seeds = [os.path.join(tests_dir, X, "template") for X in ("pg84-1", "pg84-2", "pg84-3")]
+
+phases = ["tokenise_template", "tokenise_input", "sign_template", "sign_input",
+          "build_match_list", "process_matches", "select_output", "output_paras",
+          "tokenise_paramatch", "wrap", "wrap_memo", "total"]
+
+
+def read_sentences(filenames):
+    """Reads the seed files and returns a list of their sentences, each a list of words."""
+    sentences = []
+    for filename in filenames:
+        text = tokenise.read_text(filename)
+        words = []
+        for word in text.split():
+            if word.startswith("=====#"): continue
+            words.append(word)
+            if word[-1] in ".!?;":
+                sentences.append(words)
+                words = []
+        if words:
+            sentences.append(words)
+    return sentences
+
+
+def fill(words, width, rng=None, ragged=0):
+    """Wraps a list of words into lines of at most width characters, or, if ragged is given, of
+    a random width between width - ragged and width. Returns a list of lines."""
+    lines = []
+    line = []
+    length = 0
+    limit = width
+    for word in words:
+        if line and length + 1 + len(word) > limit:
+            lines.append(u" ".join(line))
+            line, length = [], 0
+            if ragged: limit = width - rng.randint(0, ragged)
+        length += len(word) + (1 if line else 0)
+        line.append(word)
+    if line:
+        lines.append(u" ".join(line))
+    return lines
+
+
+def generate(para_count, sentences, rng, joins=0.02, splits=0.02, moves=0.005, edits=0.02,
+             page_lines=40):
+    """Generates a synthetic book of para_count paragraphs. Returns a tuple of the form
+    (template_string, input_string, counts), where counts is a dictionary of the number of each
+    perturbation applied."""
+    #a few seed files only give a few hundred distinct sentences, so some of the words of each
+    #paragraph are replaced with invented ones to keep the paragraphs distinct
+    stems = sorted(set([X for S in sentences for X in S if X.isalpha()]))
+    def invent():
+        n, suffix = rng.randrange(para_count * 4), u""
+        while n:
+            n, r = divmod(n, 26)
+            suffix += chr(ord(u"a") + r)
+        return rng.choice(stems) + suffix
+    paras = []
+    for c in range(para_count):
+        words = []
+        for s in range(rng.randint(1, 6)):
+            for word in rng.choice(sentences):
+                if rng.random() < 0.2 and word.isalpha():
+                    word = invent()
+                words.append(word)
+        paras.append(words)
+    #template: short ragged lines with a page marker every page_lines lines
+    t_lines = []
+    page = 1
+    line_count = 0
+    for c, p in enumerate(paras):
+        if c:
+            t_lines.append(u"")
+        for l in fill(p, 45, rng, 12):
+            t_lines.append(l)
+            line_count += 1
+            if line_count == page_lines:
+                t_lines.append(u"=====#%03d#=====" % page)
+                page += 1
+                line_count = 0
+    #input: edited copies of the paragraphs, rearranged and rewrapped to 72 columns
+    counts = {"joins": 0, "splits": 0, "moves": 0, "edits": 0, "page_markers": page - 1}
+    i_paras = []
+    for p in paras:
+        p = list(p)
+        for c in range(len(p)):
+            if rng.random() < edits:
+                counts["edits"] += 1
+                kind = rng.randint(0, 2)
+                if kind == 0:
+                    p[c] = rng.choice(rng.choice(sentences))
+                elif kind == 1:
+                    p[c] = p[c] + u" " + rng.choice(rng.choice(sentences))
+                elif len(p) > 1:
+                    p[c] = u""
+        p = [X for X in u" ".join(p).split()]
+        r = rng.random()
+        if i_paras and r < joins:
+            counts["joins"] += 1
+            i_paras[-1] += p
+        elif r < joins + splits and len(p) > 10:
+            counts["splits"] += 1
+            split_point = rng.randint(5, len(p) - 5)
+            i_paras += [p[:split_point], p[split_point:]]
+        else:
+            i_paras.append(p)
+    for c in range(int(len(i_paras) * moves)):
+        counts["moves"] += 1
+        p = i_paras.pop(rng.randrange(len(i_paras)))
+        i_paras.insert(rng.randrange(len(i_paras) + 1), p)
+    i_string = u"\n\n".join([u"\n".join(fill(X, 72)) for X in i_paras]) + u"\n"
+    return u"\n".join(t_lines) + u"\n", i_string, counts
+
+
+def run_phases(t_string, i_string):
+    """Runs paragraph matching and wrapping of i_string against t_string, timing each phase.
+    Returns a dictionary of the form {phase: seconds, ...} along with the counts of paragraphs and
+    the rep_rate. The memos are cleared first, so that each run is timed from cold; the wrap is
+    then repeated with the memo warm as the wrap_memo phase, which is not counted in the total."""
+    wrap.wrap_memo.clear()
+    match_paras.fuzzy_memo.clear()
+    logger = wrap.Logger(io.StringIO())
+    times = {}
+    def phase(name, f, *args):
+        start_time = time.time()
+        result = f(*args)
+        times[name] = time.time() - start_time
+        return result
+    t_tokens = phase("tokenise_template", tokenise.tokenise, t_string)
+    i_tokens = phase("tokenise_input", tokenise.tokenise, i_string)
+    t_para_list = phase("sign_template", match_paras.split_and_sign_paras, t_tokens)
+    i_para_list = phase("sign_input", match_paras.split_and_sign_paras, i_tokens)
+    #process_matches appends joined and split paras to the lists
+    t_paras, i_paras = len(t_para_list), len(i_para_list)
+    logger.set_texts(t_tokens, i_tokens)
+    matches = phase("build_match_list", match_paras.build_match_list, t_para_list, i_para_list)
+    matches = phase("process_matches", match_paras.process_matches,
+                    matches, t_para_list, i_para_list, logger)
+    selection, t_count, i_count = phase("select_output", match_paras.select_output_paras,
+                                        t_para_list, i_para_list, matches, logger)
+    o_string = phase("output_paras", lambda: u"\n".join(
+            [u"".join([X[0] for X in p])
+             for p in match_paras.output_paras(t_para_list, i_para_list, selection)]))
+    o_tokens = phase("tokenise_paramatch", tokenise.tokenise, o_string)
+    def wrap_all():
+        logger.set_texts(t_tokens, o_tokens)
+        pairs = [(c, None, None, t, o) for c, (t, o) in enumerate(
+                zip(wrap.split_paras(t_tokens), wrap.split_paras(o_tokens)))]
+        return len(list(wrap.wrap_pairs(pairs, logger)))
+    phase("wrap", wrap_all)
+    logger.flush()
+    times["total"] = sum(times.values())
+    message_bytes = len(logger.output.getvalue())
+    phase("wrap_memo", wrap_all)
+    return {"phases": times, "template_paras": t_paras, "input_paras": i_paras,
+            "message_bytes": message_bytes,
+            "rep_rate": match_paras.rep_rate(t_count, i_count)}
+
+
+def benchmark(sizes, seed_files, seed=1, repeat=1, keep=None):
+    """Generates and benchmarks a book of each size in sizes. Each phase time is the best of
+    repeat runs. If keep is a directory, the generated books are written to it. Returns a results
+    dictionary suitable for writing as JSON."""
+    sentences = read_sentences(seed_files)
+    results = {"seed": seed, "repeat": repeat, "runs": []}
+    for size in sizes:
+        rng = random.Random("%s:%s" % (seed, size))
+        t_string, i_string, counts = generate(size, sentences, rng)
+        if keep:
+            d = os.path.join(keep, "synthetic-%d" % size)
+            if not os.path.isdir(d): os.makedirs(d)
+            tokenise.write_text(os.path.join(d, "template"), t_string)
+            tokenise.write_text(os.path.join(d, "input"), i_string)
+        best = None
+        for r in range(repeat):
+            run = run_phases(t_string, i_string)
+            if best == None:
+                best = run
+            else:
+                for phase, t in run["phases"].items():
+                    best["phases"][phase] = min(best["phases"][phase], t)
+        best["paras"] = size
+        best["perturbations"] = counts
+        results["runs"].append(best)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Compares the phase times of results with those of baseline for each size they share.
+    Returns a list of the form [(paras, phase, baseline_time, time), ...] of those phases that are
+    more than threshold times slower than the baseline. Phases taking less than 10ms in both are
+    ignored as noise."""
+    regressions = []
+    base_runs = dict([(X["paras"], X) for X in baseline["runs"]])
+    for run in results["runs"]:
+        base = base_runs.get(run["paras"])
+        if not base: continue
+        for phase, t in sorted(run["phases"].items()):
+            base_t = base["phases"].get(phase)
+            if base_t == None or max(t, base_t) < 0.01: continue
+            if t > base_t * threshold:
+                regressions.append((run["paras"], phase, base_t, t))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    base_runs = dict([(X["paras"], X) for X in baseline["runs"]]) if baseline else {}
+    for run in results["runs"]:
+        print("%d paras (template %d, input %d, rep_rate %d%%)" % (
+            run["paras"], run["template_paras"], run["input_paras"], run["rep_rate"]))
+        base = base_runs.get(run["paras"])
+        for phase, t in sorted(run["phases"].items(), key=lambda X: phases.index(X[0])):
+            if base and phase in base["phases"]:
+                base_t = base["phases"][phase]
+                print("    %-20s %9.3fs %9.3fs %+7.1f%%" % (
+                    phase, t, base_t, (t - base_t) * 100 / base_t if base_t else 0.0))
+            else:
+                print("    %-20s %9.3fs" % (phase, t))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [--sizes N,N,...] [--seed N] [--repeat N] [--output FILE] "
+        "[--baseline FILE] [--threshold X] [--keep DIR] [seed_file ...]")
+    parser.add_argument("seed_files", nargs="*", default=default_seeds,
+                        help="texts to build the synthetic books from")
+    parser.add_argument("--sizes", default="1000,10000", metavar="N,N,...",
+                        help="comma separated numbers of paragraphs to benchmark")
+    parser.add_argument("--seed", type=int, default=1, metavar="N",
+                        help="random seed for generating the books")
+    parser.add_argument("--repeat", type=int, default=1, metavar="N",
+                        help="take the best of N runs of each phase")
+    parser.add_argument("--output", default="benchmark.json", metavar="FILE",
+                        help="file to write the results to")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="results of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, metavar="X",
+                        help="report phases more than X times slower than the baseline")
+    parser.add_argument("--keep", metavar="DIR",
+                        help="write the generated books to DIR")
+    args = parser.parse_args()
+    try:
+        sizes = [int(X) for X in args.sizes.split(",")]
+    except ValueError:
+        print("Usage: %s --sizes N,N,..." % sys.argv[0])
+        sys.exit(-1)
+    for filename in args.seed_files:
+        if not os.path.isfile(filename):
+            print("Seed file %s not found" % filename)
+            sys.exit(-1)
+    baseline = json.load(open(args.baseline)) if args.baseline else None
+    results = benchmark(sizes, args.seed_files, args.seed, args.repeat, args.keep)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    print_results(results, baseline)
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        for paras, phase, base_t, t in regressions:
+            print("Regression: %s at %d paras took %.3fs against %.3fs" % (
+                phase, paras, t, base_t))
+        if regressions:
+            sys.exit(-2)
+
+
+if __name__ == "__main__":
+    main()
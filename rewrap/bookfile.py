@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+"""Book files: tokenised and signed templates kept on disk.
+
+The same templates are wrapped against many inputs, and tokenising and signing a template is a
+large part of each run. A book file holds what tokenise.tokenise and
+match_paras.split_and_sign_paras produce for a template: its text, the offsets, type flags and
+word IDs of its tokens, the page numbers of its pagebreaks, its paragraph boundaries and the word
+IDs of each paragraph's signature. The file is memory mapped and its arrays are used in place, so
+loading it costs checksumming the file, decoding the text and building each paragraph's signature
+set, which is mostly the last and about a hundredth of the time taken to tokenise and sign the
+template.
+
+A header holds the format version, the byte order of the arrays, a content hash of the template
+and the tokeniser and a checksum of the rest of the file, and a file whose header does not match
+is ignored and written again. Book files
+are kept in a cache directory under the content hash of their template, so an edited template
+simply gets a new file.
+
+Word IDs are only meaningful within a process (see tokenise.Vocabulary), so a book file numbers its
+words itself and holds the words. On loading, the words are interned in that order; in a process
+that has not interned any other words first, such as each run of the command line tools, this
+gives the same IDs and the arrays are used as they are, otherwise they are translated."""
+
+import os
+import sys
+import mmap
+import array
+import struct
+import hashlib
+import zlib
+from . import tokenise
+from .stats import Stats
+
+
+MAGIC = b"REWRAPBK"
+VERSION = 2
+
+#the sections of a book file, in file order, with the array type of each, or None for UTF-8 text
+sections = [("text", None), ("starts", "I"), ("ends", "I"), ("flags", "B"), ("word_ids", "i"),
+            ("page_tokens", "I"), ("page_nos", None), ("paras", "I"), ("sig_offsets", "I"),
+            ("sig_ids", "i"), ("words", None)]
+
+#magic, version, byte order, content hash, checksum, then the offset and length of each section
+header = struct.Struct("<8sII40sI" + "QQ" * len(sections))
+
+#the checksum is a CRC-32 of the file from the end of the checksum field, so it covers the offsets
+#and lengths and every section
+checksummed = struct.calcsize("<8sII40sI")
+
+BYTE_ORDER = {"little": 0, "big": 1}[sys.byteorder]
+
+
+def content_hash(text=None, pages=None):
+    """Hash of a template given as text, or as page files as returned by tokenise.page_files, and
+    of the tokeniser, so that a change to either gives a different hash."""
+    h = hashlib.sha1(tokenise.regexp_tokens.pattern.encode("utf-8"))
+    if pages:
+        for page_no, filename in pages:
+            h.update(("\0%s\0" % page_no).encode("utf-8"))
+            with open(filename, "rb") as f:
+                h.update(f.read())
+    else:
+        h.update(b"\0")
+        h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+def book_filename(cache_dir, key):
+    return os.path.join(cache_dir, key + ".book")
+
+
+def save(filename, tokens, key, para_list=None):
+    """Writes the TokenStore tokens, whose content hash is key, to the book file filename. The
+    signatures are taken from para_list, as returned by match_paras.split_and_sign_paras for
+    tokens, if it is given. The file is written under a temporary name and moved into place, so a
+    reader never sees it half written."""
+    from . import wrap
+    from . import match_paras
+    paras = wrap.split_paras(tokens)
+    if para_list == None:
+        signatures = [match_paras.sig(X) for X in paras]
+    else:
+        signatures = [X[0] for X in para_list]
+    #number the words in order of first use
+    local = {}
+    word_ids = array.array('i', [local.setdefault(X, len(local)) if X != tokenise.NO_WORD
+                                 else tokenise.NO_WORD for X in tokens.word_ids])
+    words = [tokenise.vocabulary.words[X] for X in local]
+    sig_offsets = array.array('I', [0])
+    sig_ids = array.array('i')
+    for s in signatures:
+        sig_ids.extend(sorted([local[X] for X in s]))
+        sig_offsets.append(len(sig_ids))
+    page_tokens = sorted(tokens.pages)
+    data = {"text": tokens.text[0:len(tokens.text)].encode("utf-8"),
+            "starts": array.array('I', tokens.starts), "ends": array.array('I', tokens.ends),
+            "flags": array.array('B', tokens.flags), "word_ids": word_ids,
+            "page_tokens": array.array('I', page_tokens),
+            "page_nos": u"\0".join([tokens.pages[X] for X in page_tokens]).encode("utf-8"),
+            "paras": array.array('I', [X.start for X in paras] + [len(tokens)]),
+            "sig_offsets": sig_offsets, "sig_ids": sig_ids,
+            "words": u"\0".join(words).encode("utf-8")}
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    chunks = []
+    fields = []
+    position = header.size
+    for name, typecode in sections:
+        section = data[name]
+        if typecode: section = section.tobytes()
+        #each section starts on an 8 byte boundary so that its array can be used in place
+        padding = b"\0" * (-position % 8)
+        fields += [position + len(padding), len(section)]
+        chunks += [padding, section]
+        position += len(padding) + len(section)
+    checksum = zlib.crc32(header.pack(MAGIC, VERSION, BYTE_ORDER, key.encode("ascii"), 0,
+                                      *fields)[checksummed:])
+    for chunk in chunks:
+        checksum = zlib.crc32(chunk, checksum)
+    temp_filename = "%s.%d.tmp" % (filename, os.getpid())
+    with open(temp_filename, "wb") as f:
+        f.write(header.pack(MAGIC, VERSION, BYTE_ORDER, key.encode("ascii"), checksum, *fields))
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(temp_filename, filename)
+
+
+def load(filename, key=None):
+    """Maps the book file filename. Returns a tuple of the form (tokens, para_list) as returned by
+    tokenise.tokenise and match_paras.split_and_sign_paras, or None if the file does not exist, its
+    checksum does not match, or its header does not match this version of the format or, if it is
+    given, the content hash key. The TokenStore refers to the mapped file and is read only."""
+    try:
+        with open(filename, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        return read_book(mapped, key)
+    except (struct.error, UnicodeDecodeError, TypeError, IndexError):
+        #damaged text, a section whose length is not a whole number of array items, or word IDs
+        #or offsets out of range
+        return None
+
+
+def read_book(mapped, key):
+    """Reads the mapped book file for load. Returns None if its header or checksum does not match;
+    a damaged header may also raise an exception."""
+    from . import match_paras
+    if len(mapped) < header.size:
+        return None
+    fields = header.unpack_from(mapped)
+    magic, version, byte_order, content, checksum = fields[:5]
+    if (magic != MAGIC or version != VERSION or byte_order != BYTE_ORDER or
+        (key != None and content != key.encode("ascii"))):
+        return None
+    view = memoryview(mapped)
+    if zlib.crc32(view[checksummed:]) != checksum:
+        return None
+    book = {}
+    for c, (name, typecode) in enumerate(sections):
+        offset, length = fields[5 + 2 * c:7 + 2 * c]
+        if offset + length > len(mapped):
+            return None
+        section = view[offset:offset + length]
+        book[name] = section.cast(typecode) if typecode else str(section, "utf-8")
+    words = book["words"].split(u"\0") if book["words"] else []
+    translate = [tokenise.vocabulary.intern(X) for X in words]
+    if translate == list(range(len(words))):
+        word_ids, sig_ids = book["word_ids"], book["sig_ids"]
+    else:
+        #NO_WORD, which is -1, indexes the NO_WORD on the end of the list
+        translate.append(tokenise.NO_WORD)
+        word_ids = array.array('l', [translate[X] for X in book["word_ids"]])
+        sig_ids = array.array('l', [translate[X] for X in book["sig_ids"]])
+    tokens = tokenise.TokenStore(book["text"])
+    tokens.starts, tokens.ends, tokens.flags = book["starts"], book["ends"], book["flags"]
+    tokens.word_ids = word_ids
+    page_nos = book["page_nos"].split(u"\0") if book["page_nos"] else []
+    tokens.pages = dict(zip(book["page_tokens"], page_nos))
+    paras, sig_offsets = book["paras"], book["sig_offsets"]
+    para_list = []
+    for c in range(len(paras) - 1):
+        signature = frozenset(sig_ids[sig_offsets[c]:sig_offsets[c + 1]])
+        para_list.append(match_paras.SignedPara(signature,
+                                                tokenise.TokenView(tokens, paras[c], paras[c + 1])))
+    return tokens, para_list
+
+
+def template_book(text=None, pages=None, cache_dir=None, jobs=1, stats=None, key=None):
+    """Returns the tokens and signed paras of a template given as text, or as page files as
+    returned by tokenise.page_files, in a tuple of the form (tokens, para_list). If cache_dir is
+    given, they are loaded from the template's book file there if it is up to date, and otherwise
+    the template is tokenised, in a pool of jobs processes if it is large, and signed, and the book
+    file is written. key is the content hash of the template if it is already known. Phases and
+    counts are recorded in stats if it is given."""
+    from . import match_paras
+    if stats == None: stats = Stats()
+    filename = None
+    if cache_dir:
+        if key == None: key = content_hash(text, pages)
+        filename = book_filename(cache_dir, key)
+        with stats.phase("load_book"):
+            book = load(filename, key)
+        if book:
+            stats.count("book_hits")
+            return book
+        stats.count("book_misses")
+    with stats.phase("tokenise"):
+        tokens = tokenise.tokenise_pages(pages, jobs) if pages else tokenise.tokenise(text, jobs)
+    with stats.phase("sign"):
+        para_list = match_paras.split_and_sign_paras(tokens)
+    if filename:
+        with stats.phase("save_book"):
+            save(filename, tokens, key, para_list)
+    return tokens, para_list
+
+
+def read_template(pattern, cache_dir=None, jobs=1, stats=None):
+    """Reads the template pattern, a file or page files as taken by tokenise.read_template, and
+    returns its tokens and signed paras as template_book does."""
+    pages = tokenise.page_files(pattern)
+    text = None if pages else tokenise.read_text(pattern)
+    return template_book(text, pages, cache_dir, jobs, stats)
+
+
+def main():
+    """Writes the book file of each template given on the command line to a cache directory, so
+    that the tools find them already made."""
+    import argparse
+    parser = argparse.ArgumentParser(usage="%(prog)s [--jobs N] cache_dir template_file ...")
+    parser.add_argument("cache_dir", help="directory to keep the book files in")
+    parser.add_argument("template_files", nargs="+", metavar="template_file",
+                        help="template file, or directory or glob pattern of template page files")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                        help="read template page files and tokenise large texts in a pool of N "
+                        "processes")
+    args = parser.parse_args()
+    for pattern in args.template_files:
+        if not os.path.exists(pattern) and not tokenise.page_files(pattern):
+            print("Template %s not found" % pattern)
+            continue
+        stats = Stats()
+        read_template(pattern, args.cache_dir, args.jobs, stats)
+        print("%s: %s" % (pattern, "up to date" if stats.counters.get("book_hits") else "written"))
+
+
+if __name__ == "__main__":
+    main()
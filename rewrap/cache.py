@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+"""Incremental re-run cache for rewrap.
+
+Editors often run the tools many times on the same book, changing only a few paragraphs of the
+input between runs. A Cache remembers, for one book, a content hash of every template and input
+paragraph, the match list that build_match_list produced and the wrapped text and messages of every
+paragraph pair. On the next run:
+
+  * previous matches whose paragraphs are all still present are reused as they are, and only the
+    gaps between them that contain a new or changed paragraph go through build_match_list again;
+  * paragraph pairs that are unchanged reuse their wrapped text, and their messages are replayed,
+    rather than going through wrap_para again.
+
+Matching decisions depend on their surroundings, so a re-run after edits can differ slightly from a
+run without the cache; a re-run without edits gives the same output. The cache is keyed by the
+settings that affect the results, and is ignored if they have changed."""
+
+import os
+import json
+import io
+import hashlib
+from . import match_paras
+from . import wrap
+
+
+VERSION = 1
+
+
+def para_hash(para):
+    """Content hash of the tokens of para, ignoring surrounding whitespace."""
+    text = u"".join([X[0] for X in para]).strip()
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def pair_key(t_para, i_para):
+    """Key of the wrapped text of a pair of paras. The page numbers of the template's pagebreaks are
+    part of the output, so the key covers the paras as they are written out."""
+    text = wrap.para_string(t_para) + u"\0" + wrap.para_string(i_para)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def settings():
+    return {"version": VERSION, "match_criteria": match_paras.match_criteria,
+            "align_budget": wrap.align_budget, "densify_threshold": wrap.densify_threshold}
+
+
+def cache_filename(cache_dir, i_filename):
+    """The file in cache_dir that holds the cache for input file i_filename."""
+    key = hashlib.sha1(os.path.abspath(i_filename).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, key[:16] + ".json")
+
+
+class Cache:
+
+    def __init__(self, filename=None):
+        """Loads the cache from filename if it exists and was written with the current settings.
+        If filename is None, the cache starts empty and is never saved."""
+        self.filename = filename
+        self.t_hashes, self.i_hashes = set(), set()
+        self.matches = []
+        self.wrapped = {}
+        if filename and os.path.isfile(filename):
+            try:
+                with open(filename, encoding="utf-8") as f:
+                    data = json.load(f)
+            except ValueError:
+                data = {}
+            if data.get("settings") == settings():
+                self.t_hashes, self.i_hashes = set(data["template"]), set(data["input"])
+                self.matches = data["matches"]
+                self.wrapped = data["wrapped"]
+        self.used_wrapped = {}
+        self.new_t_hashes, self.new_i_hashes = [], []
+        self.new_matches = []
+
+
+    def build_match_list(self, t_para_list, i_para_list, stats):
+        """Drop in replacement for match_paras.build_match_list that reuses the matches of the
+        previous run wherever their paras are unchanged and unique."""
+        t_hashes = [para_hash(X[1:]) for X in t_para_list]
+        i_hashes = [para_hash(X[1:]) for X in i_para_list]
+        self.new_t_hashes, self.new_i_hashes = t_hashes, i_hashes
+        def positions(hashes):
+            pos = {}
+            for c, h in enumerate(hashes):
+                pos[h] = None if h in pos else c
+            return pos
+        t_pos, i_pos = positions(t_hashes), positions(i_hashes)
+        #reuse each previous match whose paras can all be found again
+        matches = []
+        dirty = set()
+        for m in self.matches:
+            t_ind = [t_pos.get(X) for X in m[0]]
+            i_ind = [i_pos.get(X) for X in m[1]]
+            if None in t_ind or None in i_ind:
+                dirty.update(m[0] + m[1])
+            else:
+                matches.append([t_ind, i_ind, tuple(m[2])])
+        stats.count("cache_matches_reused", len(matches))
+        #the reused one to one matches that increase in both lists divide the lists into gaps
+        seen = set()
+        chain = []
+        for m in sorted([[X[0][0], X[1][0]] for X in matches if len(X[0]) == len(X[1]) == 1]):
+            if m[1] not in seen:
+                seen.add(m[1])
+                chain.append(m)
+        chain = match_paras.heaviest_increasing_matches(chain, [1] * len(chain))
+        t_matched = set([X for m in matches for X in m[0]])
+        i_matched = set([X for m in matches for X in m[1]])
+        def changed(h, old_hashes):
+            return h not in old_hashes or h in dirty
+        for start, end in zip([[-1, -1]] + chain, chain + [[len(t_para_list), len(i_para_list)]]):
+            t_gap = [c for c in range(start[0] + 1, end[0]) if c not in t_matched]
+            i_gap = [c for c in range(start[1] + 1, end[1]) if c not in i_matched]
+            if not t_gap or not i_gap: continue
+            if not ([c for c in t_gap if changed(t_hashes[c], self.t_hashes)] or
+                    [c for c in i_gap if changed(i_hashes[c], self.i_hashes)]):
+                continue
+            stats.count("cache_gaps_rematched")
+            for m in match_paras.build_match_list([t_para_list[X] for X in t_gap],
+                                                  [i_para_list[X] for X in i_gap], stats):
+                if not m: continue
+                matches.append([[t_gap[X] for X in m[0]], [i_gap[X] for X in m[1]], m[2]])
+        #process_matches modifies the match list, so the hashes are taken now
+        self.new_matches = [[[t_hashes[X] for X in m[0]], [i_hashes[X] for X in m[1]], m[2]]
+                            for m in matches]
+        return matches
+
+
+    def wrap_pairs(self, pairs, logger, jobs=1):
+        """Drop in replacement for wrap.wrap_pairs that reuses the wrapped text of unchanged pairs.
+        The messages of each pair, reused or not, are written to logger in para order."""
+        pairs = [(pair_key(X[3], X[4]), X) for X in pairs]
+        recorder = wrap.Logger(io.StringIO())
+        recorder.recorded = {}
+        todo = [X[1] for X in pairs if X[0] not in self.wrapped]
+        logger.stats.count("cache_wraps_reused", len(pairs) - len(todo))
+        fresh = dict(zip([X[0] for X in todo], wrap.wrap_pairs(todo, recorder, jobs)))
+        logger.stats.merge(recorder.stats.as_dict())
+        for key, pair in pairs:
+            c = pair[0]
+            if key in self.wrapped:
+                text, messages = self.wrapped[key]
+            else:
+                text, messages = fresh[c], recorder.recorded.get(c, [])
+            logger.set_current_para(c, c, pair[1], pair[2])
+            for s, t_shard, i_shard in messages:
+                logger.message(s, t_shard, i_shard)
+            self.used_wrapped[key] = (text, messages)
+            yield text
+
+
+    def save(self):
+        """Writes what this run used to the cache file, replacing the previous run."""
+        if not self.filename: return
+        data = {"settings": settings(), "template": self.new_t_hashes, "input": self.new_i_hashes,
+                "matches": self.new_matches, "wrapped": self.used_wrapped}
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.filename + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(self.filename + ".tmp", self.filename)
@@ -1,22 +1,20 @@
-#!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import sys
-import tokenise
+from . import tokenise
 
 def dump_tokens(token_list, astext=False):
-    outstr = ""
+    outstr = []
     if astext:
         for t in token_list:
-            outstr += t[0]
+            outstr.append(t[0])
             if (t[1] & tokenise.TYPE_PAGEBREAK) and len(t) == 3:
-                outstr += u"=====#%s#=====\n" % t[2]
+                outstr.append(u"=====#%s#=====\n" % t[2])
     else:
         for t in token_list:
             k = [X for X in tokenise.token_description.keys() if (t[1] & X)]
-            outstr += u"{%s}: %s\n" % (
-                str([tokenise.token_description[X] for X in k]), t[0])
-    return outstr
+            outstr.append(u"{%s}: %s\n" % (
+                str([tokenise.token_description[X] for X in k]), t[0]))
+    return u"".join(outstr)
 
 
 def linebreak_to_space(tokens):
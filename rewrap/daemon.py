@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+"""This program runs match_paras, wrap and rewrap as a long-running service, so that a proofing
+site does not pay for starting Python and tokenising the same templates again for every job.
+
+Jobs are read as JSON lines from stdin, or from the connections to a Unix socket if --socket is
+given, and each is answered with one JSON line, on stdout or the connection, as soon as it is done,
+so answers may come in a different order to the jobs. A job has the form:
+
+  {"id": ..., "op": "match" | "wrap" | "rewrap",
+   "template": TEXT or "template_file": FILE, "input": TEXT or "input_file": FILE,
+   "level": "debug" | "info" | "warning" | "error"}
+
+where id is anything the client uses to tell the answers apart and level is optional. FILE names a
+file on the server; a template file may also be a directory or glob of page files (see
+tokenise.page_files). The answer has the form:
+
+  {"id": ..., "status": "ok", "text": TEXT, "t_count": N, "i_count": N,
+   "log": TEXT, "messages": [...], "stats": {...},
+   "time": {"queued": SECONDS, "run": SECONDS, "total": SECONDS}}
+
+where text is what the command line tool would have written to its output file, and log, messages
+and stats are as described for api.Diagnostics. If the job fails, status is "error" and error
+describes the problem.
+
+Jobs run in a pool of worker processes. Each worker keeps the tokenised and signed paras of the
+templates it has seen most recently, keyed by a hash of their content. Each job is sent to the
+worker with the fewest jobs, and of those to one that already holds its template, so jobs on the
+same template usually find it already tokenised without a popular template holding up the jobs
+behind it. If --cache is given, templates that are not in a worker's memory are loaded from their
+book files in that directory, or tokenised and written there (see bookfile), so a restarted
+service does not tokenise them again.
+
+A worker that dies is replaced, and the jobs it had been sent are tried once more, so only a job
+that kills a worker again fails. Each worker interns the words of every text it tokenises (see
+tokenise.Vocabulary), so a worker is also replaced, once the jobs it has been sent are done, after
+it has loaded --recycle templates."""
+
+import sys
+import os
+import io
+import json
+import time
+import asyncio
+import argparse
+import multiprocessing
+import concurrent.futures
+from . import tokenise
+from . import memo
+from . import bookfile
+
+
+#the number of templates each worker keeps tokenised
+template_cache_size = 32
+
+#the number of templates a worker loads before it is replaced
+recycle_templates = 1000
+
+#tokenised templates of this worker, {content_hash: (tokens, signed_paras)}
+templates = memo.LRU(template_cache_size)
+
+#the directory of the book files of this worker, or None if they are not kept
+book_dir = None
+
+
+def init_worker(cache_size, cache_dir=None):
+    global book_dir
+    templates.size = cache_size
+    book_dir = cache_dir
+
+
+def job_input(job):
+    if "input" in job:
+        return job["input"]
+    return tokenise.read_text(job["input_file"])
+
+
+def template_source(job):
+    """The template of job as a tuple of the form (text, pages), as taken by
+    bookfile.template_book."""
+    if "template" in job:
+        return job["template"], None
+    pages = tokenise.page_files(job["template_file"])
+    if pages:
+        return None, pages
+    return tokenise.read_text(job["template_file"]), None
+
+
+def template_key(job):
+    """The content hash of the template of job."""
+    return bookfile.content_hash(*template_source(job))
+
+
+def cached_template(job, stats, key=None):
+    """Returns the tokens and signed paras of the template of job, from the cache if a template
+    with the same content has been seen recently, or otherwise as returned by
+    bookfile.template_book. key is the content hash of the template if it is already known, in
+    which case a cached template is used without reading the template again."""
+    entry = templates.get(key) if key != None else None
+    if entry == None:
+        stats.count("template_cache_misses")
+        #the template is read again, and its hash found again, in case it has changed since key
+        #was found
+        text, pages = template_source(job)
+        key = bookfile.content_hash(text, pages)
+        entry = templates.get(key)
+        if entry == None:
+            entry = bookfile.template_book(text, pages, book_dir, stats=stats, key=key)
+            templates.put(key, entry)
+    else:
+        stats.count("template_cache_hits")
+    return entry
+
+
+def run_job(job, received, key=None):
+    """Process pool worker. Runs one job, of the form described above, and returns its answer.
+    key is the content hash of the job's template if it is already known."""
+    from . import api
+    from . import wrap
+    from . import match_paras
+    from . import rewrap
+    start_time = time.time()
+    answer = {"id": job.get("id"), "status": "ok"}
+    logger = wrap.Logger(io.StringIO(), job.get("level", "info"), io.StringIO())
+    try:
+        op = job.get("op")
+        if op not in ("match", "wrap", "rewrap"):
+            raise ValueError("Unknown op %r" % op)
+        t_tokens, t_para_list = cached_template(job, logger.stats, key)
+        i_string = job_input(job)
+        if op == "match":
+            text, t_count, i_count = match_paras.match_strings(t_tokens, i_string, logger,
+                                                               t_para_list)
+        elif op == "wrap":
+            text, t_count, i_count = wrap.wrap_strings(t_tokens, i_string, logger)
+            if text == None:
+                raise api.ParaCountMismatch(t_count, i_count)
+        else:
+            text, paramatch_string, t_count, i_count = rewrap.rewrap(
+                t_tokens, i_string, logger, t_para_list=t_para_list)
+        diagnostics = api.Diagnostics(logger)
+        answer.update({"text": text, "t_count": t_count, "i_count": i_count,
+                       "log": diagnostics.log, "messages": diagnostics.messages,
+                       "stats": diagnostics.stats})
+    except Exception as e:
+        answer = {"id": job.get("id"), "status": "error", "error": "%s: %s" % (
+                e.__class__.__name__, e)}
+    end_time = time.time()
+    answer["time"] = {"queued": start_time - received, "run": end_time - start_time,
+                      "total": end_time - received}
+    return answer
+
+
+class StdinReader:
+    """Reads the lines of stdin in a thread, since stdin may be a file, which asyncio cannot
+    read without blocking."""
+
+    async def readline(self):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+
+class Server:
+
+    def __init__(self, workers, cache_size=template_cache_size, cache_dir=None,
+                 recycle=recycle_templates):
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+        self.recycle = recycle
+        #a pool of one process per worker, so that jobs can be sent to the worker that holds their
+        #template
+        self.workers = [self.new_worker() for X in range(workers)]
+        #the number of jobs sent to each worker and not yet answered
+        self.load = [0] * workers
+        #the content hashes of the templates each worker holds, kept in the same order as the
+        #worker's own cache so that the same templates fall out of both
+        self.held = [memo.LRU(cache_size) for X in range(workers)]
+        #the number of templates each worker has loaded
+        self.loaded = [0] * workers
+        #start the workers now, so that the first jobs do not wait for them
+        for w in self.workers:
+            w.submit(int).result()
+
+
+    def new_worker(self):
+        #workers are started by a fork server, as workers forked from here once connections are
+        #open would inherit them and keep them open after they are closed here
+        return concurrent.futures.ProcessPoolExecutor(
+            1, mp_context=multiprocessing.get_context("forkserver"), initializer=init_worker,
+            initargs=(self.cache_size, self.cache_dir))
+
+
+    def replace_worker(self, w, executor):
+        """Replaces worker w with a new process, unless executor, the worker's process pool when a
+        job was sent to it, has already been replaced. The old process finishes the jobs it has
+        been sent, unless it has died."""
+        if self.workers[w] is executor:
+            executor.shutdown(wait=False)
+            self.workers[w] = self.new_worker()
+            self.held[w] = memo.LRU(self.cache_size)
+            self.loaded[w] = 0
+
+
+    def worker(self, key):
+        """The index of the worker for a job whose template has the content hash key: the worker
+        with the fewest jobs, preferring one that holds the template."""
+        return min(range(len(self.workers)),
+                   key=lambda X: (self.load[X], self.held[X].get(key) == None))
+
+
+    async def dispatch(self, job, received, key):
+        """Runs job, whose template has the content hash key, on a worker and returns its answer.
+        Raises BrokenProcessPool, having replaced the worker, if the worker dies."""
+        loop = asyncio.get_running_loop()
+        w = self.worker(key)
+        executor = self.workers[w]
+        if self.held[w].get(key) == None:
+            self.loaded[w] += 1
+        self.held[w].put(key, True)
+        self.load[w] += 1
+        try:
+            future = loop.run_in_executor(executor, run_job, job, received, key)
+            if self.recycle and self.loaded[w] >= self.recycle:
+                self.replace_worker(w, executor)
+            return await future
+        except concurrent.futures.process.BrokenProcessPool:
+            self.replace_worker(w, executor)
+            raise
+        finally:
+            self.load[w] -= 1
+
+
+    async def run(self, line):
+        """Runs the job on line and returns its answer as a JSON line."""
+        received = time.time()
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError("A job must be a JSON object")
+        except ValueError as e:
+            answer = {"id": None, "status": "error", "error": "Bad job: %s" % e}
+        else:
+            loop = asyncio.get_running_loop()
+            try:
+                #hashing a template file reads it, so it is done in a thread
+                key = await loop.run_in_executor(None, template_key, job)
+                try:
+                    answer = await self.dispatch(job, received, key)
+                except concurrent.futures.process.BrokenProcessPool:
+                    #the worker died, perhaps running another job, so the job is tried once more
+                    answer = await self.dispatch(job, received, key)
+            except Exception as e:
+                #e.g. the template could not be read, or the worker process died
+                answer = {"id": job.get("id"), "status": "error", "error": "%s: %s" % (
+                        e.__class__.__name__, e)}
+        if "time" not in answer:
+            #the job failed before a worker ran it
+            end_time = time.time()
+            answer["time"] = {"queued": end_time - received, "run": 0.0,
+                              "total": end_time - received}
+        return json.dumps(answer) + "\n"
+
+
+    async def serve(self, reader, write):
+        """Runs each job read from reader, passing each answer to write as soon as it is ready.
+        Returns when reader reaches EOF and every job has been answered."""
+        pending = set()
+        async def answer(line):
+            write(await self.run(line))
+        while True:
+            line = await reader.readline()
+            if not line: break
+            if not line.strip(): continue
+            task = asyncio.ensure_future(answer(line.decode("utf-8")))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+
+
+    async def serve_connection(self, reader, writer):
+        await self.serve(reader, lambda s: writer.write(s.encode("utf-8")))
+        await writer.drain()
+        writer.close()
+
+
+    async def serve_stdin(self):
+        reader = StdinReader()
+        def write(s):
+            sys.stdout.write(s)
+            sys.stdout.flush()
+        await self.serve(reader, write)
+
+
+    async def serve_socket(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self.serve_connection, path, limit=2 ** 30)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+    def shutdown(self):
+        for w in self.workers:
+            w.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [--socket PATH] [--workers N] [--templates N] [--recycle N] [--cache DIR]")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="accept jobs on the Unix socket PATH rather than stdin")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, metavar="N",
+                        help="run jobs in a pool of N processes")
+    parser.add_argument("--templates", type=int, default=template_cache_size, metavar="N",
+                        help="number of tokenised templates each worker keeps")
+    parser.add_argument("--recycle", type=int, default=recycle_templates, metavar="N",
+                        help="replace each worker after it has loaded N templates, so that the "
+                        "words it has interned do not grow without bound; 0 never replaces them")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="keep the tokenised and signed templates in book files in DIR")
+    args = parser.parse_args()
+    server = Server(max(1, args.workers), max(1, args.templates), args.cache,
+                    max(0, args.recycle))
+    try:
+        if args.socket:
+            asyncio.run(server.serve_socket(args.socket))
+        else:
+            asyncio.run(server.serve_stdin())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
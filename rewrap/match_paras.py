@@ -0,0 +1,706 @@
+# -*- coding: utf-8 -*-
+
+"""
+The purpose of match_para is to take two files consisting of a template file and an input file and
+output a file that has the same paragraph structure as the template file but as much content as
+possible from the input file.
+
+Matching of paragraphs is achieved by comparing paragraph signatures. A signature is a set
+consisting of the paragraph's words converted to lowercase plus any digits it may contain. Thus the
+signature is unaffected by differences in spacing, punctuation, line breaking or capitalisation.
+
+The process is to first find exactly matching signatures and use these to break the files into
+subsections. Matching subsections are then compared more closely to find paragraphs that are near
+matches. The global variable match_criteria defines what is "close enough" to be considered a near
+match.
+
+An attempt is also made to deal with paragraphs that have either been split or joined. There are
+many corner cases in this aspect, so only those cases that can be processed with reasonable
+certainty are automated and warnings are generated for those where manual intervention will be
+required. In general, joining appears to be relatively robust but splitting often proves tricky.
+"""
+
+from . import tokenise
+import sys
+import os.path
+import heapq
+import collections
+from .common import linebreak_to_space
+from . import wrap
+from .stats import Stats
+from . import memo
+
+
+match_criteria = 0.85
+
+#the scores of the most recently compared pairs of signatures that fuzzy_match_p had to intersect
+fuzzy_memo = memo.LRU(4096)
+
+
+def sig(tokens):
+    """Makes a signature for a list of tokens by creating a frozen set consisting of the interned
+    IDs of all the words lower-cased. This makes signatures quite robust across many of the normal
+    edition differences such as punctuation changes and case changes."""
+    return frozenset([X for X in tokenise.word_ids(tokens) if X != tokenise.NO_WORD])
+
+
+class SignedPara:
+    """A signed para, as made by split_and_sign_paras. Item 0 is the signature and the rest are the
+    para's tokens, which are held as they are given, so the paras of a TokenStore are held as
+    TokenViews and the paras that are only compared by signature never have their tokens made.
+    Slicing gives a new list, as it does for a list."""
+
+    def __init__(self, signature, tokens):
+        self.signature = signature
+        self.tokens = tokens
+
+
+    def __len__(self):
+        return len(self.tokens) + 1
+
+
+    def __iter__(self):
+        yield self.signature
+        for t in self.tokens:
+            yield t
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if start >= 1 and step == 1:
+                return list(self.tokens[start - 1:max(start, stop) - 1])
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if index == 0:
+            return self.signature
+        return self.tokens[index - 1]
+
+
+def split_and_sign_paras(tokens):
+    """Split a list of tokens into a list of signed paragraphs of the form:
+    [[sig1, tok1.1, tok1.2...], [sig2, tok2.1, tok2.2, ...], ...]
+    where each paragraph is a SignedPara."""
+    return [SignedPara(sig(X), X) for X in wrap.split_paras(tokens)]
+
+
+def make_para_dict(para_list):
+    """Take a signed para_list (as output by split_and_sign_paras) and create a dictionary with the
+    para's sig as key and the indexes of matching paras as value in the form [index1, ...]. The
+    indexes will be in document order."""
+    para_dict = {}
+    for c, para_desc in enumerate(para_list):
+        key = para_desc[0]
+        if key in para_dict:
+            para_dict[key].append(c)
+        else:
+            para_dict[key] = [c]
+    return para_dict
+
+
+def match_paras(para_list_1, para_list_2):
+    """Find "exact" matches where sigs are equal in para_list_1 and para_list_2. Returns a list of
+    matching indexes of the form [[ind, ind], [ind, ind], ...]."""
+    para_dict = make_para_dict(para_list_2)
+    para_match_list = []
+    for c, p in enumerate(para_list_1):
+        if p[0] in para_dict and para_dict[p[0]]:
+            d = para_dict[p[0]][0]
+            para_match_list.append([c, d, (1.0, 1.0)])
+            del para_dict[p[0]][0]
+    return para_match_list
+
+
+def fuzzy_match_p(t_sig, i_sig, intersection_len=None):
+    """Predicate function for determining whether two paragraphs probabalistically match. Returns
+    False if it is unlikely that they match. Returns a tuple pair of the form:
+       (template_match_probability, input_match_probability)
+    if one signature is a near subset of the other. If the size of the intersection of the two
+    signatures is already known it may be passed as intersection_len. Otherwise the result is kept
+    in fuzzy_memo, keyed by the signatures, since intersecting them is the costly part."""
+    if intersection_len == None:
+        key = (t_sig, i_sig)
+        match_probs = fuzzy_memo.get(key)
+        if match_probs == None:
+            match_probs = fuzzy_match_p(t_sig, i_sig, len(t_sig & i_sig))
+            fuzzy_memo.put(key, match_probs)
+        return match_probs
+    max_intersection_len = min(len(t_sig), len(i_sig))
+    #match criteria is global set at the top of this file
+    if float(intersection_len)/max_intersection_len < match_criteria : return False
+    t_match = float(intersection_len) / len(t_sig)
+    i_match = float(intersection_len) / len(i_sig)
+    return (t_match, i_match)
+
+
+def min_overlap(size):
+    """The smallest intersection that fuzzy_match_p accepts between a signature of size words and
+    a signature at least as large."""
+    overlap = int(match_criteria * size)
+    while overlap > 0 and float(overlap - 1) / size >= match_criteria: overlap -= 1
+    while overlap < size and float(overlap) / size < match_criteria: overlap += 1
+    return overlap
+
+
+def word_counts(*para_lists):
+    """Counts the number of signatures of the signed para lists that contain each word."""
+    counts = collections.Counter()
+    for paras in para_lists:
+        for p in paras:
+            if p[0]: counts.update(p[0])
+    return counts
+
+
+def sig_prefix(signature, counts):
+    """The rarest words of signature, by counts as returned by word_counts, of which any signature
+    at least as large that it could match must contain one. If it matches, at most
+    len(signature) - min_overlap(len(signature)) of its words are missing from the other, so one of
+    any one more than that is shared."""
+    n = len(signature) - min_overlap(len(signature)) + 1
+    return heapq.nsmallest(n, signature, key=lambda X: (counts[X], X))
+
+
+def make_word_index(paras, counts=None):
+    """Take a signed para list and create an inverted index with each signature word as key and
+    the indexes of the paras whose signature contains that word as value. If counts, as returned by
+    word_counts, is given, only the words of the sig_prefix of each signature are indexed. Paras
+    with empty or None signatures are not indexed."""
+    word_index = {}
+    for c, p in enumerate(paras):
+        if not p[0]: continue
+        for w in (sig_prefix(p[0], counts) if counts else p[0]):
+            if w in word_index:
+                word_index[w].append(c)
+            else:
+                word_index[w] = [c]
+    return word_index
+
+
+def fuzzy_candidates(t_paras, i_paras):
+    """Generator that yields the pairs of indexes (t_para_index, i_para_index) of the paras whose
+    signatures could satisfy match_criteria, so that only these need scoring. fuzzy_match_p
+    compares the intersection with the smaller signature, which must therefore share a word of its
+    sig_prefix with the larger one. The sig_prefix of the template para is looked up in an index of
+    the whole signatures of the input paras that are at least as large, and the whole template
+    signature in an index of the sig_prefixes of the input paras that are smaller. The prefixes
+    hold the rarest words, so the common words that most paras share are rarely looked up. The
+    pairs are yielded in order."""
+    counts = word_counts(t_paras, i_paras)
+    whole_index = make_word_index(i_paras)
+    prefix_index = make_word_index(i_paras, counts)
+    for ct, pt in enumerate(t_paras):
+        if not pt[0]: continue
+        size = len(pt[0])
+        candidates = set()
+        for w in sig_prefix(pt[0], counts):
+            candidates.update([X for X in whole_index.get(w, ()) if len(i_paras[X][0]) >= size])
+        for w in pt[0]:
+            candidates.update([X for X in prefix_index.get(w, ()) if len(i_paras[X][0]) < size])
+        for ci in sorted(candidates):
+            yield ct, ci
+
+
+def join_or_split(m1, m2):
+    """Determines whether match m2 continues match m1 (both of the form output by
+    fuzzy_match_paras) as a join, where consecutive input paras match the same template para, or as
+    a split, where consecutive template paras match the same input para. Returns "join", "split" or
+    None."""
+    if m1[0][-1] == m2[0][0] and m1[1][-1] + 1 == m2[1][0]:
+        return "join"
+    elif m1[0][-1] + 1 == m2[0][0] and m1[1][-1] == m2[1][0]:
+        return "split"
+    return None
+
+
+def merged_sig(paras, index_list):
+    """The signature of the paras at index_list joined together. Since a signature is a set, this is
+    just the union of their signatures, so no tokens need to be copied."""
+    if len(index_list) == 1:
+        return paras[index_list[0]][0]
+    return frozenset().union(*[paras[i][0] for i in index_list])
+
+
+def fuzzy_match_paras(t_paras, i_paras):
+    """Find matches in the t_paras list and i_paras list. The sigs in these lists may be None if an
+    exact matches have already been made. Returns a list of matches of the form:
+      [[[t_para_index, ...], [i_para_index, ...], (t_match_prob, i_match_prob)], ...].
+    Multiple t_para_indexes indicate the input paragraph requires splitting, multiple i_para_indexes
+    indicates the input paragraph requires joining. Joins and splits are grown a paragraph at a
+    time, so any number of paragraphs may be joined or split."""
+    match_list = []
+    for ct, ci in fuzzy_candidates(t_paras, i_paras):
+        t_sig, i_sig = t_paras[ct][0], i_paras[ci][0]
+        match_probs = fuzzy_match_p(t_sig, i_sig, len(t_sig & i_sig))
+        if match_probs:
+            match_list.append([[ct], [ci], match_probs])
+    #process joins and splits
+    positions = dict([((X[0][0], X[1][0]), d) for d, X in enumerate(match_list)])
+    c = 0
+    while c + 1 < len(match_list):
+        m = match_list[c]
+        #try the next match first, otherwise look further ahead for a match that continues a join
+        #or split of this one
+        d = c + 1
+        kind = join_or_split(m, match_list[d])
+        if not kind:
+            for d in (positions.get((m[0][-1], m[1][-1] + 1)),
+                      positions.get((m[0][-1] + 1, m[1][-1]))):
+                if d != None and d > c + 1 and match_list[d]:
+                    kind = join_or_split(m, match_list[d])
+                    if kind: break
+        if kind:
+            if kind == "join":
+                candidate = [m[0], m[1] + match_list[d][1]]
+            else:
+                candidate = [m[0] + match_list[d][0], m[1]]
+            match_probs = fuzzy_match_p(merged_sig(t_paras, candidate[0]),
+                                        merged_sig(i_paras, candidate[1]))
+            if match_probs and sum(match_probs[:2]) > sum(m[2][:2]):
+                match_list[d] = candidate + [match_probs]
+                match_list[c] = None
+        c += 1
+    #now drop anything where either criteria is below match criteria:
+    for c, m in enumerate(match_list):
+        if m and (min(*m[2]) < match_criteria):
+            match_list[c] = None
+    return match_list
+
+
+def join_paras(para_list):
+    """Turns para_list into a single para"""
+    para = []
+    for p in para_list:
+        para += p[1:]
+    return SignedPara(sig(para), para)
+
+
+def break_para(t_paras, i_para, logger):
+    """Breaks i_para into a list of paras that approximately match those in the t_paras list"""
+    #normalise t_paras
+    t_tokens = join_paras(t_paras)[1:]
+    linebreak_to_space(t_tokens)
+    #normalise i_para
+    i_tokens = i_para[1:]
+    i_oldtokens = i_tokens[:]
+    linebreak_to_space(i_tokens)
+    #insert parabreak tokens into t_tokens
+    c = 0
+    for p in t_paras:
+        c += len(p) - 1
+        assert t_tokens[c - 1][1] & tokenise.TYPE_SPACE
+        t_tokens[c - 1] = ["\n", tokenise.TYPE_LINEBREAK | tokenise.TYPE_PARABREAK]
+    #wrap i_tokens using t_tokens
+    i_tokens = wrap.wrap_para(t_tokens, i_tokens, logger)
+    #copy old linebreaks back into i_tokens
+    for c, t in enumerate(i_oldtokens):
+        if (t[1] & tokenise.TYPE_LINEBREAK) and (i_tokens[c][1] & tokenise.TYPE_SPACE):
+            i_tokens[c] = t
+    return split_and_sign_paras(i_tokens)
+
+
+
+def process_matches(matches, t_para_list, i_para_list, logger):
+    """Processes the joins and splits indicated by a match list of the form output by
+    build_match_list into a simpler form where each index list contains only one index, i.e. it
+    produces a 1-to-1 mapping of template paragraphs to input paragraphs. Split and joined
+    paragraphs are appended to i_para_list as necessary."""
+    #modify i_para_list and matches for joins
+    for c, m in enumerate(matches):
+        if len(m[1]) > 1:
+            joined_para = []
+            logger.set_current_para(m[0][0], m[1][0])
+            logger.message("Info: Joining input paras %s" % (
+                    ", ".join(["%04d" % (X + logger.input_first) for X in m[1]])))
+            logger.stats.count("joins")
+            for ci in m[1]:
+                joined_para += i_para_list[ci][1:-1] + [["\n", tokenise.TYPE_LINEBREAK]]
+            i_para_list.append(SignedPara(sig(joined_para), joined_para))
+            matches[c][1] = [len(i_para_list) - 1]
+    #modify i_para_list and matches for splits
+    new_matches = []
+    for c, m in enumerate(matches):
+        if len(m[0]) > 1:
+            t_paras = []
+            logger.set_current_para(m[0][0], m[1][0])
+            logger.message("Info: Splitting input para (template paras %s)" % (
+                    ", ".join(["%04d" % (X + logger.template_first) for X in m[0]])))
+            logger.stats.count("splits")
+            for i in m[0]:
+                t_paras.append(t_para_list[i])
+            with logger.stats.phase("break_para"):
+                split_paras = break_para(t_paras, i_para_list[m[1][0]], logger)
+            for d, i in enumerate(m[0]):
+                if d >= len(split_paras): break
+                i_para_list.append(split_paras[d])
+                match_prob = fuzzy_match_p(t_para_list[i][0], split_paras[d][0])
+                if match_prob and min(*match_prob) >= match_criteria:
+                    new_matches.append([[i], [len(i_para_list) - 1], match_prob])
+            matches[c] = None
+    matches += new_matches
+    matches = [X for X in matches if X]
+    matches.sort()
+    return matches
+
+
+def heaviest_increasing_matches(matches, weights):
+    """Takes a list of matches of the form [[t_index, i_index, ...], ...], sorted by t_index and
+    with no repeated i_index, plus a weight for each match, and returns the subsequence in which
+    i_index also increases that has the greatest total weight. A binary indexed tree over i_index
+    ranks keeps this O(n log n)."""
+    ranks = dict([(i, r + 1) for r, i in enumerate(sorted([X[1] for X in matches]))])
+    tree = [(0, None)] * (len(matches) + 1) #(best total weight, index of its last match)
+    prev = [None] * len(matches)
+    best = (0, None)
+    for c, m in enumerate(matches):
+        #best chain ending at an i_index lower than this one
+        r, below = ranks[m[1]] - 1, (0, None)
+        while r > 0:
+            below = max(below, tree[r])
+            r -= r & -r
+        prev[c] = below[1]
+        total = (below[0] + weights[c], c)
+        best = max(best, total)
+        r = ranks[m[1]]
+        while r < len(tree):
+            tree[r] = max(tree[r], total)
+            r += r & -r
+    chain = []
+    c = best[1]
+    while c != None:
+        chain.append(matches[c])
+        c = prev[c]
+    chain.reverse()
+    return chain
+
+
+def anchor_matches(t_para_list, i_para_list, subdivide=True):
+    """Finds exact matches that can safely be used to divide the para lists into gaps. Paras whose
+    signatures occur exactly once in both lists are matched and the heaviest chain of these that
+    increases in both lists is kept, weighting each by the size of its signature so that long
+    paragraphs are preferred to short ones. Each gap between the anchors is then subdivided the same
+    way, using signatures that are unique within the gap, until no more anchors are found, unless
+    subdivide is False. Returns a list of matching indexes of the form [[t_ind, i_ind], ...] in
+    document order."""
+    anchors = []
+    stack = [(0, len(t_para_list), 0, len(i_para_list))]
+    while stack:
+        t_start, t_end, i_start, i_end = stack.pop()
+        if t_start >= t_end or i_start >= i_end: continue
+        t_dict = make_para_dict(t_para_list[t_start:t_end])
+        i_dict = make_para_dict(i_para_list[i_start:i_end])
+        unique = [[t_dict[k][0] + t_start, i_dict[k][0] + i_start]
+                  for k in t_dict if k and len(t_dict[k]) == 1 and len(i_dict.get(k, ())) == 1]
+        if not unique: continue
+        unique.sort()
+        chain = heaviest_increasing_matches(unique, [len(t_para_list[X[0]][0]) for X in unique])
+        anchors += chain
+        if not subdivide: break
+        for start, end in zip([[t_start - 1, i_start - 1]] + chain, chain + [[t_end, i_end]]):
+            stack.append((start[0] + 1, end[0], start[1] + 1, end[1]))
+    anchors.sort()
+    return anchors
+
+
+def moved_matches(t_para_list, i_para_list, t_matched, i_matched):
+    """Finds exact matches between the paras of t_para_list and i_para_list whose indexes are not in
+    the sets t_matched and i_matched, wherever they are, so that paragraphs moved from one gap to
+    another are found. Only signatures that occur exactly once among the unmatched paras of both
+    lists are matched, since a repeated para, such as a scene break, could be paired with one in
+    another gap instead of the one in its own. Returns a list of matching indexes of the form
+    [[t_ind, i_ind, (1.0, 1.0)], ...]."""
+    t_rest = [c for c in range(len(t_para_list)) if c not in t_matched]
+    i_rest = [c for c in range(len(i_para_list)) if c not in i_matched]
+    t_dict = make_para_dict([t_para_list[X] for X in t_rest])
+    i_dict = make_para_dict([i_para_list[X] for X in i_rest])
+    return sorted([[t_rest[t_dict[k][0]], i_rest[i_dict[k][0]], (1.0, 1.0)]
+                   for k in t_dict if k and len(t_dict[k]) == 1 and len(i_dict.get(k, ())) == 1])
+
+
+def build_match_list(t_para_list, i_para_list, stats=None):
+    """Takes two lists of paragraphs and calculates a match list of the form:
+      [[[t_para_index, ...], [i_para_index, ...], (t_match_prob, i_match_prob)], ...]
+    The anchors found by anchor_matches divide the lists into gaps. Exact matches are then made
+    between the paras of each gap, and then by moved_matches between the paras still unmatched,
+    wherever they are, so that moved paragraphs are still found. Finally fuzzy matches are looked
+    for between the paras in each gap that are still unmatched. If stats is given, the time taken
+    by each of these steps and the sizes of the gaps are recorded in it."""
+    if stats == None: stats = Stats()
+    memo_counts = fuzzy_memo.hits, fuzzy_memo.misses
+    with stats.phase("anchor_matches"):
+        anchors = anchor_matches(t_para_list, i_para_list)
+    stats.count("anchors", len(anchors))
+    #[(start, end), ...] of the gaps, where start and end are [t_index, i_index]
+    gaps = [([X + 1 for X in start[:2]], end) for start, end in zip(
+            [[-1, -1]] + anchors, anchors + [[len(t_para_list), len(i_para_list)]])]
+    with stats.phase("exact_matches"):
+        exact_matches = [[X[0], X[1], (1.0, 1.0)] for X in anchors]
+        for start, end in gaps:
+            exact_matches += [[X[0] + start[0], X[1] + start[1], X[2]] for X in match_paras(
+                    t_para_list[start[0]:end[0]], i_para_list[start[1]:end[1]])]
+        moved = moved_matches(t_para_list, i_para_list, set([X[0] for X in exact_matches]),
+                              set([X[1] for X in exact_matches]))
+        exact_matches += moved
+    stats.count("exact_matches", len(exact_matches) - len(anchors))
+    stats.count("moved_matches", len(moved))
+    exact_matches.sort()
+    matches = [[[X] for X in m] for m in exact_matches]
+    t_matched = set([X[0] for X in exact_matches])
+    i_matched = set([X[1] for X in exact_matches])
+    def unmatched(para_list, start, end, matched):
+        return [[None] if c in matched else para_list[c] for c in range(start, end)]
+    for start, end in gaps:
+        if end[0] <= start[0] or end[1] <= start[1]: continue
+        t_fuzzy = unmatched(t_para_list, start[0], end[0], t_matched)
+        i_fuzzy = unmatched(i_para_list, start[1], end[1], i_matched)
+        stats.record("gap_template_paras", len(t_fuzzy))
+        stats.record("gap_input_paras", len(i_fuzzy))
+        with stats.phase("fuzzy_matches"):
+            fuzzy_matches = fuzzy_match_paras(t_fuzzy, i_fuzzy)
+        for fm in fuzzy_matches:
+            if not fm: continue
+            stats.count("fuzzy_matches")
+            fm[0] = [X + start[0] for X in fm[0]]
+            fm[1] = [X + start[1] for X in fm[1]]
+            matches.append(fm)
+    stats.count("fuzzy_memo_hits", fuzzy_memo.hits - memo_counts[0])
+    stats.count("fuzzy_memo_misses", fuzzy_memo.misses - memo_counts[1])
+    return matches
+
+
+def select_output_paras(t_para_list, i_para_list, matches, logger):
+    """Takes the simplified match list produced by process_matches plus the template paragraph list
+    and modified input paragraph list and selects the paragraph to output for each template
+    paragraph. Where a match exists between a template paragraph and an input paragraph, the input
+    paragraph is selected; otherwise the template paragraph is retained and a warning issued. This
+    function also calculates the usage rates of template and input tokens. Returns a tuple of the
+    form (selection, t_count, i_count), where selection has an entry for each template paragraph
+    that is either the index of the selected input paragraph or None if the template paragraph is
+    retained, and the counts are the number of template and input tokens used."""
+    outdict = {}
+    for m in matches:
+        if m[0][0] not in outdict:#chooses first match if multiples
+            outdict[m[0][0]] = m[1][0]
+    selection = []
+    t_count, i_count = 0, 0
+    for c in range(0, len(t_para_list)):
+        if c in outdict:
+            selection.append(outdict[c])
+            i_count += len(i_para_list[outdict[c]][1:])
+        else:
+            logger.set_current_para(c)
+            shard = t_para_list[c][1:16]
+            if len(shard) == 15:
+                shard[14] = [u"…", tokenise.TYPE_PUNC]
+            logger.message("Warning: Retaining template para", shard)
+            selection.append(None)
+            t_count += len(t_para_list[c][1:])
+    return selection, t_count, i_count
+
+
+def output_paras(t_para_list, i_para_list, selection):
+    """Generator yielding the token list of each paragraph selected by select_output_paras. If the
+    first input paragraph is moved, the linebreaks at the start of the input stay at the start of
+    the output rather than moving with it."""
+    lead = 0
+    if i_para_list and selection and selection[0] != 0 and 0 in selection:
+        for t in i_para_list[0][1:]:
+            if t[1] != tokenise.TYPE_LINEBREAK: break
+            lead += 1
+    for c, i in enumerate(selection):
+        if i == None:
+            para = t_para_list[c][1:]
+        else:
+            para = i_para_list[i][1:]
+        if i == 0:
+            para = para[lead:]
+        if c == 0 and lead:
+            para = i_para_list[0][1:lead + 1] + para
+        yield para
+
+
+def build_output(t_para_list, i_para_list, matches, logger):
+    """Builds an output string from the paragraphs selected by select_output_paras. Returns a tuple
+    of the form (output_string, t_count, i_count)."""
+    selection, t_count, i_count = select_output_paras(t_para_list, i_para_list, matches, logger)
+    outstrings = ["".join([X[0] for X in p])
+                  for p in output_paras(t_para_list, i_para_list, selection)]
+    return "\n".join(outstrings), t_count, i_count
+
+
+def rep_rate(t_count, i_count):
+    """The percentage of output tokens that came from the input file."""
+    return i_count * 100 // (t_count + i_count)
+
+
+def match_strings(t_string, i_string, logger=None, t_para_list=None, jobs=1):
+    """Matches the paragraphs of i_string to those of the template t_string, which may also be a
+    TokenStore as returned by tokenise.read_template. If t_string is a TokenStore, its signed paras,
+    as returned by split_and_sign_paras, may be passed as t_para_list if they are already known;
+    they are not modified. Large texts are tokenised in a pool of jobs processes. Messages are
+    written to logger, or a wrap.Logger writing to stdout if it is None. Returns a tuple of the form
+    (output_string, t_count, i_count) as calculated by build_output."""
+    if logger == None: logger = wrap.Logger()
+    stats = logger.stats
+    #process template into para list
+    with stats.phase("tokenise"):
+        t_tokens = tokenise.as_tokens(t_string, jobs)
+    if t_para_list == None:
+        with stats.phase("sign"):
+            t_para_list = split_and_sign_paras(t_tokens)
+    #process input into para list
+    with stats.phase("tokenise"):
+        i_tokens = tokenise.tokenise(i_string, jobs)
+    with stats.phase("sign"):
+        i_para_list = split_and_sign_paras(i_tokens)
+    stats.count_texts(t_tokens, i_tokens, t_para_list, i_para_list)
+    #process token lists
+    logger.set_texts(t_tokens, i_tokens)
+    matches = build_match_list(t_para_list, i_para_list, stats)
+    with stats.phase("process_matches"):
+        matches = process_matches(matches, t_para_list, i_para_list, logger)
+    # for m in matches:
+    #     print("%04d = %04d : %3d%%" % (m[0][0], m[1][0], int(math.ceil(min(*m[2]) * 100))))
+    with stats.phase("output"):
+        outstr, t_count, i_count = build_output(t_para_list, i_para_list, matches, logger)
+    logger.flush()
+    return outstr, t_count, i_count
+
+
+def match_windows(t_filename, i_filename, outfile, window=1000, logger=None):
+    """Matches the paragraphs of the input file i_filename to those of the template t_filename,
+    which may be page files as for wrap.read_paras, a window of paras at a time, writing the output
+    to outfile as each window is committed. Only the paras of the current window are held in
+    memory, so this is for books too big to match at once.
+
+    Up to window paras of each file are read, and the window is committed up to the last anchor,
+    i.e. the last of the exact matches unique in both windows that anchor_matches finds, since
+    nothing before it can match anything after it. The paras after it are carried over to the next
+    window. If there are no anchors, the window is doubled, up to four times its size, before it is
+    committed in full. A para is only matched within its window, so paragraphs moved further than
+    a window are retained from the template rather than found. Returns a tuple of the form
+    (t_count, i_count) as calculated by build_output. Raises ValueError if window is less than
+    1."""
+    #a window of no paras would never be filled or committed
+    if window < 1:
+        raise ValueError("window must be at least 1")
+    if logger == None: logger = wrap.Logger()
+    stats = logger.stats
+    sources = [wrap.read_paras(t_filename), wrap.read_paras(i_filename)]
+    windows = [[], []] #[(line_no, signed_para), ...] of template and input
+    done = [False, False]
+    firsts = [0, 0]
+    size = window
+    t_count, i_count = 0, 0
+    while windows[0] or windows[1] or not all(done):
+        #fill the windows
+        with stats.phase("tokenise"):
+            for c in 0, 1:
+                while not done[c] and len(windows[c]) < size:
+                    try:
+                        line_no, para = next(sources[c])
+                    except StopIteration:
+                        done[c] = True
+                        break
+                    windows[c].append((line_no, SignedPara(sig(para), para)))
+        t_window, i_window = [X[1] for X in windows[0]], [X[1] for X in windows[1]]
+        #find the end of the part of the window that can be committed
+        if all(done):
+            t_cut, i_cut = len(t_window), len(i_window)
+        else:
+            with stats.phase("anchor_matches"):
+                anchors = anchor_matches(t_window, i_window, False)
+            if anchors:
+                t_cut, i_cut = anchors[-1][0] + 1, anchors[-1][1] + 1
+            elif size < window * 4:
+                size *= 2
+                continue
+            else:
+                t_cut, i_cut = len(t_window), len(i_window)
+        size = window
+        stats.count("windows")
+        stats.record("window_template_paras", t_cut)
+        t_para_list, i_para_list = t_window[:t_cut], i_window[:i_cut]
+        stats.count("template_paras", len(t_para_list))
+        stats.count("input_paras", len(i_para_list))
+        stats.count("template_tokens", sum([len(X) - 1 for X in t_para_list]))
+        stats.count("input_tokens", sum([len(X) - 1 for X in i_para_list]))
+        logger.set_window(firsts[0], firsts[1], [X[0] for X in windows[0][:t_cut]],
+                          [X[0] for X in windows[1][:i_cut]])
+        matches = build_match_list(t_para_list, i_para_list, stats)
+        with stats.phase("process_matches"):
+            matches = process_matches(matches, t_para_list, i_para_list, logger)
+        with stats.phase("output"):
+            outstr, window_t_count, window_i_count = build_output(
+                t_para_list, i_para_list, matches, logger)
+            if t_para_list:
+                if firsts[0]: outfile.write("\n")
+                outfile.write(outstr)
+        logger.flush()
+        t_count += window_t_count
+        i_count += window_i_count
+        firsts = [firsts[0] + t_cut, firsts[1] + i_cut]
+        windows = [windows[0][t_cut:], windows[1][i_cut:]]
+    return t_count, i_count
+
+
+def match_files(t_filename, i_filename, logger=None, jobs=1, window=None, cache_dir=None):
+    """Loads the template and input files and processes them into an output file. The template may
+    be page files, as taken by tokenise.read_template. The template and input are read and
+    tokenised in a pool of jobs processes. The output file will have the same name as the input
+    file with ".paramatch" appended. If window is given, the files are matched a window of that
+    many paras at a time by match_windows, and the output file is written as each window is
+    committed. Otherwise, if cache_dir is given, the tokenised and signed template is kept there in
+    a book file (see bookfile). Messages are written to logger, or a wrap.Logger writing to stdout
+    if it is None. Returns a tuple of the form (t_count, i_count) as calculated by build_output."""
+    if logger == None: logger = wrap.Logger()
+    if window:
+        with open(i_filename + ".paramatch", "w", encoding="utf-8", newline="") as outfile:
+            t_count, i_count = match_windows(t_filename, i_filename, outfile, window, logger)
+    else:
+        t_para_list = None
+        if cache_dir:
+            from . import bookfile
+            t_string, t_para_list = bookfile.read_template(t_filename, cache_dir, jobs,
+                                                           logger.stats)
+        else:
+            t_string = tokenise.read_template(t_filename, jobs)
+        outstr, t_count, i_count = match_strings(t_string, tokenise.read_text(i_filename), logger,
+                                                 t_para_list, jobs)
+        tokenise.write_text(i_filename + ".paramatch", outstr)
+    print("t_count:", t_count, "i_count:", i_count, "rep_rate:",
+          str(rep_rate(t_count, i_count)) + "%", file=logger.output or sys.stdout)
+    return t_count, i_count
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [--jobs N] [--window N] [--cache DIR] [--log-level LEVEL] "
+        "[--report FILE] [--stats] template_file input_file")
+    parser.add_argument("template_file",
+                        help="template file, or directory or glob pattern of template page files")
+    parser.add_argument("input_file")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                        help="read template page files and tokenise large texts in a pool of N "
+                        "processes")
+    parser.add_argument("--window", type=int, metavar="N",
+                        help="match N paragraphs at a time, writing the output as it goes, to "
+                        "bound memory use for very large books")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="keep the tokenised and signed template in DIR")
+    wrap.add_logging_arguments(parser)
+    args = parser.parse_args()
+    if args.window != None and args.window < 1:
+        parser.error("--window must be at least 1")
+    if not wrap.template_exists(args.template_file) or not os.path.isfile(args.input_file):
+        print("Usage: %s template_file input_file" % sys.argv[0])
+        sys.exit(-1)
+    logger = wrap.logger_from_arguments(args)
+    match_files(args.template_file, args.input_file, logger, args.jobs, args.window, args.cache)
+    if args.stats:
+        sys.stdout.write(logger.stats.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""Bounded memoisation for results that books compute many times over, such as the wrapping of
+repeated chapter headings and scene breaks.
+
+An LRU holds at most size results, discarding the least recently used when it is full, and counts
+its hits and misses so that they can be recorded in the stats. Each process has its own memos, so
+in a process pool each worker's memos persist from one batch to the next. An LRU is locked, so a
+process that calls api from several threads can share its memos between them."""
+
+import threading
+import collections
+
+
+class LRU:
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        #an entry may be evicted by one thread between another's lookup and move_to_end
+        self.lock = threading.Lock()
+
+
+    def get(self, key, default=None):
+        """Returns the value stored for key, or default if there is none, counting a hit or miss."""
+        with self.lock:
+            value = self.entries.get(key, self)
+            if value is self:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def tokens_key(*token_lists):
+    """Key for one or more lists of tokens, covering the text, type flags and page number of each
+    token. The dictionary hashes the key, and compares it in full on a hash match, so different
+    token lists never share a result."""
+    key = []
+    for tokens in token_lists:
+        key.append(len(tokens))
+        key.extend([tuple(X) for X in tokens])
+    return tuple(key)
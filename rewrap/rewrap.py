@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+"""This program combines match_paras and wrap into a single pass. It takes a template file and an
+input file and produces the same input.paramatch.wrap file as running match_paras.py followed by
+wrap.py, but the matched paragraphs are passed directly from the paragraph matching stage to the
+wrapping stage rather than being written to input.paramatch and tokenised again. Each file is
+therefore only tokenised once.
+
+The input.paramatch file is only written if requested, as a debugging aid."""
+
+import sys
+import os
+from . import tokenise
+from . import match_paras
+from . import wrap
+
+
+def paramatch_tokens(tokens, first, last, rescan):
+    """Returns the tokens that would be produced for the output paragraph tokens if the output of
+    match_paras were written to a file and tokenised again. first and last are True if tokens is
+    the first or last paragraph of the output. If rescan is True, tokens may have been modified by
+    process_matches and are scanned again from their text; otherwise they came straight from the
+    tokeniser and only their flags need adjusting."""
+    if last:
+        tokens = list(tokenise.tokenise(u"".join([X[0] for X in tokens])))
+    elif rescan:
+        text = u"".join([X[0] for X in tokens])
+        store = tokenise.TokenStore(text)
+        tokenise.scan(text, store, len(text))
+        tokens = list(store)
+    else:
+        #pagebreak markers are not written to the .paramatch file
+        tokens = [[X[0], X[1] & ~tokenise.TYPE_PAGEBREAK] for X in tokens]
+    if not first:
+        #leading linebreaks merge into the parabreak of the previous paragraph
+        c = 0
+        while c < len(tokens) and tokens[c][1] & tokenise.TYPE_LINEBREAK:
+            c += 1
+        del tokens[:c]
+    if tokens and not last:
+        #paragraphs are joined by a blank line, so each ends with a parabreak
+        tokens[-1][1] |= tokenise.TYPE_PARABREAK
+    return tokens
+
+
+def rewrap(t_string, i_string, logger=None, jobs=1, cache=None, t_para_list=None):
+    """Matches the paragraphs of i_string to those of the template t_string, which may also be a
+    TokenStore as returned by tokenise.read_template, and wraps them. If t_string is a TokenStore,
+    its signed paras, as returned by match_paras.split_and_sign_paras, may be passed as t_para_list
+    if they are already known; they are not modified. Large texts are tokenised, and paras wrapped,
+    in a pool of jobs processes. Messages are written to logger, or a wrap.Logger writing to stdout
+    if it is None. If cache, a cache.Cache, is given, the matches and wrapped paras of its previous
+    run are reused where the paras are unchanged, and it is updated with this run. Returns a tuple
+    of the form (wrapped_string, paramatch_string, t_count, i_count), where paramatch_string is
+    what match_paras would have output and the counts are as calculated by
+    match_paras.select_output_paras."""
+    #match stage
+    if logger == None: logger = wrap.Logger()
+    stats = logger.stats
+    with stats.phase("tokenise"):
+        t_tokens = tokenise.as_tokens(t_string, jobs)
+        i_tokens = tokenise.tokenise(i_string, jobs)
+    with stats.phase("sign"):
+        if t_para_list == None:
+            t_para_list = match_paras.split_and_sign_paras(t_tokens)
+        i_para_list = match_paras.split_and_sign_paras(i_tokens)
+    i_para_count = len(i_para_list)
+    stats.count_texts(t_tokens, i_tokens, t_para_list, i_para_list)
+    logger.set_texts(t_tokens, i_tokens)
+    if cache:
+        matches = cache.build_match_list(t_para_list, i_para_list, stats)
+    else:
+        matches = match_paras.build_match_list(t_para_list, i_para_list, stats)
+    with stats.phase("process_matches"):
+        matches = match_paras.process_matches(matches, t_para_list, i_para_list, logger)
+    with stats.phase("output"):
+        selection, t_count, i_count = match_paras.select_output_paras(
+            t_para_list, i_para_list, matches, logger)
+    logger.flush()
+    print("t_count:", t_count, "i_count:", i_count, "rep_rate:",
+          str(match_paras.rep_rate(t_count, i_count)) + "%", file=logger.output or sys.stdout)
+    o_paras = list(match_paras.output_paras(t_para_list, i_para_list, selection))
+    paramatch_string = "\n".join(["".join([X[0] for X in p]) for p in o_paras])
+    #wrap stage
+    logger.set_texts(t_tokens, None)
+    t_lines = wrap.para_line_numbers(t_tokens)
+    def pairs():
+        i_line = 1
+        for c, (t_para, o_para, i) in enumerate(zip(t_para_list, o_paras, selection)):
+            text = u"".join([X[0] for X in o_para])
+            leading = text[:len(text) - len(text.lstrip())]
+            i_para = paramatch_tokens(o_para, c == 0, c == len(o_paras) - 1,
+                                      i != None and i >= i_para_count)
+            yield (c, t_lines[c], i_line + leading.count("\n"),
+                   t_para[1:], i_para)
+            i_line += text.count("\n") + 1
+    with stats.phase("wrap"):
+        if cache:
+            wrapped_string = "\n".join(cache.wrap_pairs(pairs(), logger, jobs))
+            cache.save()
+        else:
+            wrapped_string = "\n".join(wrap.wrap_pairs(pairs(), logger, jobs))
+    logger.flush()
+    return wrapped_string, paramatch_string, t_count, i_count
+
+
+def rewrap_files(t_filename, i_filename, paramatch=False, logger=None, jobs=1, cache_dir=None):
+    """Loads the template and input files and processes them with rewrap. The template may be page
+    files, as taken by tokenise.read_template, which are read in a pool of jobs processes. The
+    output file will have the same name as the input file with ".paramatch.wrap" appended. If
+    paramatch is True, the output of the paragraph matching stage is also written to a file with
+    ".paramatch" appended. If cache_dir is given, the results of the previous run on the input file
+    are kept there and reused where the paragraphs are unchanged, as is the template's book file
+    (see bookfile). Returns a tuple of the form (t_count, i_count)."""
+    i_string = tokenise.read_text(i_filename)
+    book_cache = None
+    t_para_list = None
+    if cache_dir:
+        from . import cache
+        from . import bookfile
+        book_cache = cache.Cache(cache.cache_filename(cache_dir, i_filename))
+        t_string, t_para_list = bookfile.read_template(t_filename, cache_dir, jobs,
+                                                       logger.stats if logger else None)
+    else:
+        t_string = tokenise.read_template(t_filename, jobs)
+    wrapped_string, paramatch_string, t_count, i_count = rewrap(t_string, i_string, logger, jobs,
+                                                                book_cache, t_para_list)
+    if paramatch:
+        tokenise.write_text(i_filename + ".paramatch", paramatch_string)
+    tokenise.write_text(i_filename + ".paramatch.wrap", wrapped_string)
+    return t_count, i_count
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [--paramatch] [--jobs N] [--cache DIR] [--log-level LEVEL] "
+        "[--report FILE] [--stats] template_file input_file")
+    parser.add_argument("template_file",
+                        help="template file, or directory or glob pattern of template page files")
+    parser.add_argument("input_file")
+    parser.add_argument("--paramatch", action="store_true",
+                        help="also write the paragraph matching output to input_file.paramatch")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                        help="read template page files, tokenise large texts and wrap "
+                        "paragraphs in a pool of N processes")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="reuse the results of the previous run on input_file, kept in DIR, "
+                        "for the paragraphs that are unchanged, and keep the tokenised template "
+                        "there")
+    wrap.add_logging_arguments(parser)
+    args = parser.parse_args()
+    if not wrap.template_exists(args.template_file) or not os.path.isfile(args.input_file):
+        print("Usage: %s template_file input_file" % sys.argv[0])
+        sys.exit(-1)
+    logger = wrap.logger_from_arguments(args)
+    rewrap_files(args.template_file, args.input_file, args.paramatch, logger, args.jobs,
+                 args.cache)
+    if args.stats:
+        sys.stdout.write(logger.stats.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""Timing and counter instrumentation for match_paras and wrap.
+
+A Stats object records the wall and CPU time spent in each named phase, named counters, histograms
+of values such as gap sizes and shard lengths, and the slowest paragraphs. Every Logger carries one,
+so anything that is passed a logger can record into it. as_dict returns everything recorded as a
+dictionary, which can be merged into another Stats object, e.g. from a process pool worker, and
+report formats it for the --stats option of the command line tools."""
+
+import os
+import time
+import heapq
+import contextlib
+
+
+def cpu_time():
+    """User plus system CPU time of this process."""
+    t = os.times()
+    return t[0] + t[1]
+
+
+def bucket(value):
+    """The power of two histogram bucket for value, i.e. the smallest power of two >= value."""
+    b = 1
+    while b < value:
+        b *= 2
+    return b
+
+
+class Stats:
+
+    def __init__(self, slowest_count=10):
+        self.phases = {} #name: [wall_time, cpu_time, calls]
+        self.counters = {}
+        self.histograms = {} #name: {bucket: count}
+        self.slowest_count = slowest_count
+        self.slowest = [] #heap of (seconds, description)
+
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager that adds the time spent in its body to phase name."""
+        wall, cpu = time.time(), cpu_time()
+        try:
+            yield
+        finally:
+            p = self.phases.setdefault(name, [0.0, 0.0, 0])
+            p[0] += time.time() - wall
+            p[1] += cpu_time() - cpu
+            p[2] += 1
+
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def count_texts(self, t_tokens, i_tokens, t_paras, i_paras):
+        """Counts the tokens and paras of a template and input text."""
+        self.count("template_tokens", len(t_tokens))
+        self.count("input_tokens", len(i_tokens))
+        self.count("template_paras", len(t_paras))
+        self.count("input_paras", len(i_paras))
+
+
+    def record(self, name, value):
+        """Adds value to histogram name."""
+        h = self.histograms.setdefault(name, {})
+        b = bucket(value)
+        h[b] = h.get(b, 0) + 1
+
+
+    def para_time(self, seconds, description):
+        """Records the time taken to process a paragraph, keeping only the slowest."""
+        if len(self.slowest) < self.slowest_count:
+            heapq.heappush(self.slowest, (seconds, description))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, description))
+
+
+    def as_dict(self):
+        return {"phases": dict([(k, {"wall": v[0], "cpu": v[1], "calls": v[2]})
+                                for k, v in self.phases.items()]),
+                "counters": dict(self.counters),
+                "histograms": dict([(k, dict(v)) for k, v in self.histograms.items()]),
+                "slowest": [{"seconds": X[0], "para": X[1]}
+                            for X in sorted(self.slowest, reverse=True)]}
+
+
+    def merge(self, d):
+        """Adds the stats in d, as returned by as_dict, to these stats."""
+        for k, v in d["phases"].items():
+            p = self.phases.setdefault(k, [0.0, 0.0, 0])
+            p[0] += v["wall"]
+            p[1] += v["cpu"]
+            p[2] += v["calls"]
+        for k, v in d["counters"].items():
+            self.count(k, v)
+        for k, v in d["histograms"].items():
+            h = self.histograms.setdefault(k, {})
+            for b, n in v.items():
+                h[b] = h.get(b, 0) + n
+        for s in d["slowest"]:
+            self.para_time(s["seconds"], s["para"])
+
+
+    def report(self):
+        """Returns the stats formatted as text."""
+        lines = ["Phases:", "    %-24s %10s %10s %8s" % ("", "wall_s", "cpu_s", "calls")]
+        for k, v in sorted(self.phases.items()):
+            lines.append("    %-24s %10.3f %10.3f %8d" % (k, v[0], v[1], v[2]))
+        lines.append("Counters:")
+        for k, v in sorted(self.counters.items()):
+            lines.append("    %-24s %10d" % (k, v))
+        for k, v in sorted(self.histograms.items()):
+            lines.append("Histogram %s:" % k)
+            for b, n in sorted(v.items()):
+                lines.append("    <= %-21d %10d" % (b, n))
+        if self.slowest:
+            lines.append("Slowest paragraphs:")
+            for seconds, description in sorted(self.slowest, reverse=True):
+                lines.append("    %-24s %10.3f" % (description, seconds))
+        return "\n".join(lines) + "\n"
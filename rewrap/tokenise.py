@@ -0,0 +1,605 @@
+import re
+import os
+import sys
+import glob
+import time
+import array
+import bisect
+import threading
+
+(TYPE_UNKNOWN, TYPE_WORD, TYPE_DIGIT,
+ TYPE_SPACE, TYPE_PUNC, TYPE_NOTE,
+  TYPE_LINEBREAK, TYPE_PARABREAK, TYPE_PAGEBREAK) = (
+    0x00, 0x01, 0x02,
+    0x04, 0x08, 0x10,
+    0x20, 0x40, 0x80)
+
+token_description = dict(zip(
+    [0x00, 0x01, 0x02,
+    0x04, 0x08, 0x10,
+    0x20, 0x40, 0x80],
+    ["Unknown", "Word", "Digit",
+     "Space", "Punctuation", "Note",
+     "Linebreak", "Parabreak", "Pagebreak" ]))
+
+WORD_TYPES = TYPE_WORD | TYPE_DIGIT
+NO_WORD = -1
+
+
+class Vocabulary:
+    """Interns strings as small integers, so that they need only be lower-cased and hashed once.
+    IDs are only meaningful within the process that interned them. Texts may be tokenised in
+    several threads at once, so new words are added under a lock."""
+
+    def __init__(self):
+        self.ids = {}
+        self.words = []
+        self.lock = threading.Lock()
+
+
+    def intern(self, word):
+        word_id = self.ids.get(word)
+        if word_id == None:
+            with self.lock:
+                word_id = self.ids.get(word)
+                if word_id == None:
+                    #the word is added before its ID, so an ID is never seen without its word
+                    self.words.append(word)
+                    word_id = self.ids[word] = len(self.words) - 1
+        return word_id
+
+
+    def __len__(self):
+        return len(self.words)
+
+
+#the vocabulary shared by all tokenised texts
+vocabulary = Vocabulary()
+
+
+def word_ids(tokens):
+    """Returns a sequence with the interned ID of each lower-cased word or digit token of tokens,
+    or NO_WORD for other tokens. The IDs of a TokenStore or TokenView are the ones recorded when
+    the text was tokenised, so nothing is interned again."""
+    if isinstance(tokens, TokenView):
+        return tokens.store.word_ids[tokens.start:tokens.stop]
+    if isinstance(tokens, TokenStore):
+        return tokens.word_ids
+    return [vocabulary.intern(t[0].lower()) if t[1] & WORD_TYPES else NO_WORD for t in tokens]
+
+
+class TokenStore:
+    """A compact store for the tokens of a text. Rather than holding each token as a list, the
+    store holds the start and end offset of each token in its text, the token type flags in an
+    array('B') and the page numbers of pagebreak tokens in a side table keyed by token index. The
+    interned ID of each word or digit token is also recorded (see word_ids).
+
+    Indexing the store with an integer produces a token of the usual form, [text, type_flags] or
+    [text, type_flags, page_no]. Slicing it produces a TokenView, which refers back to the store
+    rather than copying any tokens."""
+
+    def __init__(self, text):
+        self.text = text
+        self.starts = array.array('L')
+        self.ends = array.array('L')
+        self.flags = array.array('B')
+        self.word_ids = array.array('l')
+        self.pages = {}
+
+
+    def append(self, start, end, type_flags, page_no=None):
+        if page_no != None:
+            self.pages[len(self.flags)] = page_no
+        self.starts.append(start)
+        self.ends.append(end)
+        self.flags.append(type_flags)
+        if type_flags & WORD_TYPES:
+            self.word_ids.append(vocabulary.intern(self.text[start:end].lower()))
+        else:
+            self.word_ids.append(NO_WORD)
+
+
+    def token(self, c):
+        tok = [self.text[self.starts[c]:self.ends[c]], self.flags[c]]
+        if c in self.pages:
+            tok.append(self.pages[c])
+        return tok
+
+
+    def __len__(self):
+        return len(self.flags)
+
+
+    def __iter__(self):
+        for c in range(len(self.flags)):
+            yield self.token(c)
+
+
+    def __getitem__(self, index):
+        return TokenView(self, 0, len(self.flags))[index]
+
+
+class TokenView:
+    """A lightweight, read-only view of the tokens start to stop of a TokenStore. Behaves as a
+    sequence of tokens; slicing a view produces another view of the same store."""
+
+    def __init__(self, store, start, stop):
+        self.store = store
+        self.start = start
+        self.stop = stop
+
+
+    def __len__(self):
+        return self.stop - self.start
+
+
+    def __iter__(self):
+        for c in range(self.start, self.stop):
+            yield self.store.token(c)
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[X] for X in range(start, stop, step)]
+            stop = max(start, stop)
+            return TokenView(self.store, self.start + start, self.start + stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token index out of range")
+        return self.store.token(self.start + index)
+
+
+    def __eq__(self, other):
+        if len(self) != len(other): return False
+        for a, b in zip(self, other):
+            if a != b: return False
+        return True
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+_pagebreak = r"\n=====#[\d]+#====="
+_note = r"\[\*\*(?:(?!%s)[^\]])*\]" % _pagebreak
+
+#A single alternation covering every character of the text. The order of the alternatives, and
+#the negative lookaheads, give pagebreaks precedence over notes, and notes precedence over
+#everything else, so the token stream is the same as splitting by each in turn.
+regexp_tokens = re.compile("|".join([
+            r"(?P<pagebreak>\n=====#(?P<page_no>[\d]+)#=====)",
+            r"(?P<note>%s)" % _note,
+            r"(?P<digit>\d+)",
+            r"(?P<word>(?:(?!\d)[^\W_])+)",
+            r"(?P<linebreak>(?:(?!%s)\n)+)" % _pagebreak,
+            r"(?P<space>[^\S\n]+)",
+            r"(?P<punc>(?:(?!%s)(?:[^\w\s]|_))+)" % _note]),
+                           re.UNICODE)
+
+regexp_pagebreak = re.compile(_pagebreak)
+
+simple_types = {"note": TYPE_NOTE, "digit": TYPE_DIGIT, "word": TYPE_WORD,
+                "space": TYPE_SPACE, "punc": TYPE_PUNC}
+
+
+def scan(text, tokens, endpos, pending_pagebreak=None):
+    """Scan text up to endpos with regexp_tokens, appending the tokens to the TokenStore tokens.
+    pending_pagebreak is the page number of a pagebreak not yet attached to a linebreak token; the
+    value still pending at endpos is returned."""
+    for mo in regexp_tokens.finditer(text, 0, endpos):
+        kind = mo.lastgroup
+        if kind == "linebreak":
+            type_flags = TYPE_LINEBREAK
+            if mo.end() - mo.start() > 1:
+                type_flags |= TYPE_PARABREAK
+            if pending_pagebreak:
+                type_flags |= TYPE_PAGEBREAK
+            tokens.append(mo.start(), mo.start() + 1, type_flags, pending_pagebreak)
+            pending_pagebreak = None
+        elif kind == "pagebreak":
+            pending_pagebreak = mo.group("page_no")
+        else:
+            tokens.append(mo.start(), mo.end(), simple_types[kind])
+    return pending_pagebreak
+
+
+def add_final_break(tokens, pending_pagebreak):
+    text = tokens.text
+    if pending_pagebreak:
+        tokens.append(len(text) - 1, len(text), TYPE_LINEBREAK|TYPE_PAGEBREAK, pending_pagebreak)
+    else:
+        tokens.append(len(text) - 1, len(text), TYPE_LINEBREAK)
+
+
+#texts of at least twice this many characters are tokenised in chunks in a pool of processes when
+#more than one job is allowed
+parallel_chunk_size = 1 << 18
+
+#a chunk of tokenise_chunks is cut at the next paragraph break once it holds this many characters,
+#even if a note is left open, so that an unclosed note cannot hold the rest of the text in memory
+stream_chunk_limit = 1 << 20
+
+
+def tokenise(text, jobs=1):
+    """Split text into tokens in a single pass of regexp_tokens. Returns a TokenStore. If jobs is
+    greater than 1 and the text is large, it is tokenised in a pool of jobs processes (see
+    tokenise_parallel). All of the tokeniser's state is held by the call, so texts may be
+    tokenised in several threads at once."""
+    if jobs > 1 and len(text) >= 2 * parallel_chunk_size:
+        return tokenise_parallel(text, jobs)
+    text = text.rstrip() + u"\n"
+    tokens = TokenStore(text)
+    pending_pagebreak = scan(text, tokens, len(text) - 1)
+    add_final_break(tokens, pending_pagebreak)
+    return tokens
+
+
+def note_open(text, start=0, end=None):
+    """True if a note is left open at the end of text[start:end], so that the text cannot be cut
+    there. A note cannot contain a pagebreak, so a pagebreak after the last note start closes it."""
+    if end == None: end = len(text)
+    note = text.rfind(u"[**", start, end)
+    return (note != -1 and note > text.rfind(u"]", start, end) and
+            not regexp_pagebreak.search(text, note, end))
+
+
+def tokenise_chunks(lines):
+    """Tokenise an iterable of lines, such as a file, a chunk at a time. Each chunk ends with a
+    paragraph break, so the text never needs to be held in memory in full. Yields tuples of the
+    form (line_no, tokens), where line_no is the line number of the first line of the chunk and
+    tokens is a TokenStore of the chunk. Concatenating the chunks gives the same tokens as
+    tokenising the joined lines with tokenise.
+
+    A chunk is only cut before a line with non-space content that follows an empty line, that
+    cannot start a pagebreak and while no note is left open, since these are the only places
+    that scanning the rest of the text could not change the tokens of the chunk. Once a chunk
+    holds stream_chunk_limit characters, an open note no longer prevents the cut, so a note
+    spanning more than that is tokenised as if it were not closed.
+
+    Only an empty line breaks a paragraph, so text whose paragraphs are separated by lines holding
+    spaces, or by CRLF line ends, is a single paragraph to the tokeniser and is held in one chunk,
+    as it is held in one paragraph by tokenise."""
+    buf = []
+    size = 0
+    line_no = 1
+    pending = None
+    for line in lines:
+        if (len(buf) >= 2 and buf[-1] == u"\n" and buf[-2].endswith(u"\n") and
+            line.strip() and not line.startswith(u"=")):
+            text = u"".join(buf)
+            if size >= stream_chunk_limit or not note_open(text):
+                tokens = TokenStore(text)
+                pending = scan(text, tokens, len(text), pending)
+                yield line_no, tokens
+                line_no += len(buf)
+                buf = []
+                size = 0
+        buf.append(line)
+        size += len(line)
+    text = u"".join(buf).rstrip() + u"\n"
+    tokens = TokenStore(text)
+    pending = scan(text, tokens, len(text) - 1, pending)
+    add_final_break(tokens, pending)
+    yield line_no, tokens
+
+
+#the places that tokenise_chunks may cut a text: the start of a line with non-space content, that
+#cannot start a pagebreak, following an empty line
+regexp_chunk_cut = re.compile(r"(?<=\n\n)(?!=)(?=[^\S\n]*\S)")
+
+
+def chunk_bounds(text, size):
+    """Cuts text into chunks of at least size characters at the places that tokenise_chunks would
+    cut it. Returns a list of the form [(start, end), ...] covering the text."""
+    bounds = []
+    start = pos = 0
+    while True:
+        #the empty line must follow a line of the chunk
+        mo = regexp_chunk_cut.search(text, max(pos, start + size, start + 2))
+        if not mo: break
+        pos = mo.start()
+        if note_open(text, start, pos):
+            pos += 1
+            continue
+        bounds.append((start, pos))
+        start = pos
+    bounds.append((start, len(text)))
+    return bounds
+
+
+def scan_chunk(chunk):
+    """Process pool worker. Tokenises one chunk of the form (text, offset, last), where offset is
+    the offset of the chunk in the whole text and last is True for the last chunk. Returns a tuple
+    of the form (starts, ends, flags, pages, word_ids, words, pending_pagebreak), where the first
+    four are as held by a TokenStore, with starts and ends as offsets in the whole text, word_ids
+    are numbered in order of first use in the chunk, and words holds the word of each of them."""
+    text, offset, last = chunk
+    tokens = TokenStore(text)
+    if last:
+        add_final_break(tokens, scan(text, tokens, len(text) - 1))
+        pending_pagebreak = None
+    else:
+        pending_pagebreak = scan(text, tokens, len(text))
+    local = {}
+    ids = array.array('l', [local.setdefault(X, len(local)) if X != NO_WORD else NO_WORD
+                            for X in tokens.word_ids])
+    words = [vocabulary.words[X] for X in local]
+    starts = array.array('L', [X + offset for X in tokens.starts])
+    ends = array.array('L', [X + offset for X in tokens.ends])
+    return starts, ends, tokens.flags, tokens.pages, ids, words, pending_pagebreak
+
+
+def tokenise_parallel(text, jobs):
+    """Tokenises text in a pool of jobs processes. The text is cut into chunks at paragraph breaks,
+    as tokenise_chunks would cut it, and the tokens of the chunks are stitched together. Returns a
+    TokenStore with the same tokens and word IDs as tokenise."""
+    text = text.rstrip() + u"\n"
+    bounds = chunk_bounds(text, max(len(text) // (jobs * 4), parallel_chunk_size))
+    items = [(text[s:e], s, c == len(bounds) - 1) for c, (s, e) in enumerate(bounds)]
+    import multiprocessing
+    pool = multiprocessing.Pool(min(jobs, len(items)))
+    tokens = TokenStore(text)
+    pending_pagebreak = None
+    try:
+        for starts, ends, flags, pages, ids, words, chunk_pending in pool.imap(scan_chunk, items):
+            start = len(tokens)
+            tokens.starts.extend(starts)
+            tokens.ends.extend(ends)
+            tokens.flags.extend(flags)
+            for c, p in pages.items():
+                tokens.pages[start + c] = p
+            #words are interned in order of first use, as they are by tokenise; NO_WORD, which is
+            #-1, indexes the NO_WORD on the end of the list
+            translate = [vocabulary.intern(X) for X in words] + [NO_WORD]
+            tokens.word_ids.extend([translate[X] for X in ids])
+            #a pagebreak left pending by the previous chunk goes on the first linebreak of this
+            #one, unless a pagebreak of this chunk comes before it
+            if pending_pagebreak:
+                for c in range(start, len(tokens)):
+                    if tokens.flags[c] & TYPE_LINEBREAK:
+                        if c not in tokens.pages:
+                            tokens.flags[c] |= TYPE_PAGEBREAK
+                            tokens.pages[c] = pending_pagebreak
+                        pending_pagebreak = None
+                        break
+            pending_pagebreak = chunk_pending or pending_pagebreak
+    finally:
+        pool.terminate()
+    return tokens
+
+
+#a pagebreak marker line, as written by proofers and split-file.py
+regexp_page_marker = re.compile(r"^=====#(\d+)#=====[^\n]*\n?", re.MULTILINE)
+
+
+def page_index(text):
+    """Finds the pagebreak markers of text in a single pass. Returns a list of the form
+    [(page_no, start, end), ...] in text order, where page_no is the number in the marker as a
+    string and text[start:end] is the text of the page that the marker ends, i.e. the text between
+    the previous marker line, or the start of text, and this one. Any text after the last marker
+    belongs to no page."""
+    if isinstance(text, PagedText):
+        return list(text.index)
+    index = []
+    start = 0
+    for mo in regexp_page_marker.finditer(text):
+        index.append((mo.group(1), start, mo.start()))
+        start = mo.end()
+    return index
+
+
+class PagedText:
+    """The text of a template that is held as the texts of its pages, as if they were joined with a
+    page marker line after each. Supports len, slicing and count, which are all that a TokenStore
+    and wrap.para_line_numbers need, so the pages are never joined into one string. index is the
+    page index of the text, as returned by page_index."""
+
+    def __init__(self):
+        self.segments = []
+        self.offsets = array.array('L')
+        self.length = 0
+        self.index = []
+
+
+    def add(self, segment, page_no, page_start, page_end):
+        """Adds segment, which holds the text segment[page_start:page_end] of page page_no, to the
+        end of the text. Returns the offset of segment in the text."""
+        offset = self.length
+        self.segments.append(segment)
+        self.offsets.append(offset)
+        self.length += len(segment)
+        self.index.append((page_no, offset + page_start, offset + page_end))
+        return offset
+
+
+    def __len__(self):
+        return self.length
+
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            if index < 0: index += self.length
+            return self[index:index + 1]
+        start, stop, step = index.indices(self.length)
+        pieces = []
+        c = bisect.bisect_right(self.offsets, start) - 1
+        while start < stop:
+            offset = self.offsets[c]
+            pieces.append(self.segments[c][start - offset:stop - offset])
+            start = offset + len(self.segments[c])
+            c += 1
+        return u"".join(pieces)
+
+
+    def count(self, sub, start=0, end=None):
+        """As str.count, for a sub that does not span pages, such as a newline."""
+        if end == None: end = self.length
+        n = 0
+        for offset, segment in zip(self.offsets, self.segments):
+            if offset + len(segment) <= start: continue
+            if offset >= end: break
+            n += segment.count(sub, max(start - offset, 0), end - offset)
+        return n
+
+
+#the page number in the name of a page file, as written by split-file.py, e.g. "023" or "p023.txt"
+regexp_page_file = re.compile(r"(\d+)\D*$")
+
+
+def page_files(pattern):
+    """Finds the page files of a template given as a directory, or a glob pattern, of files named by
+    their page numbers. Returns a list of the form [(page_no, filename), ...] in page order, where
+    page_no is the last number in the file name as a string, or None if pattern is an ordinary file
+    or there are no page files."""
+    if os.path.isfile(pattern): return None
+    if os.path.isdir(pattern):
+        filenames = [os.path.join(pattern, X) for X in os.listdir(pattern)]
+    else:
+        filenames = glob.glob(pattern)
+    pages = []
+    for filename in filenames:
+        mo = regexp_page_file.search(os.path.basename(filename))
+        if mo and os.path.isfile(filename):
+            pages.append((int(mo.group(1)), mo.group(1), filename))
+    pages.sort()
+    return [X[1:] for X in pages] or None
+
+
+def read_page(filename):
+    """Reads a page file. The text of a page always ends with a newline unless it is empty, since
+    the page marker that follows it starts a line."""
+    text = read_text(filename)
+    if text and not text.endswith(u"\n"):
+        text += u"\n"
+    return text
+
+
+def page_lines(pages):
+    """Generator that yields the lines of the page files pages, as returned by page_files, each page
+    followed by its page marker line, as they would be read from the joined template file."""
+    for page_no, filename in pages:
+        lines = read_page(filename).split(u"\n")
+        for line in lines[:-1]:
+            yield line + u"\n"
+        yield u"=====#%s#=====\n" % page_no
+
+
+def scan_page(page):
+    """Process pool worker. Reads and tokenises one page of the form
+    (page_no, filename, first, last), where first and last are True for the first and last pages.
+    Returns a tuple of the form (tokens, pending_pagebreak, page_start, page_end), where tokens is
+    a TokenStore of the segment of the joined template from the end of the marker of the previous
+    page to the end of the marker of this page, and segment[page_start:page_end] is the text of
+    the page."""
+    page_no, filename, first, last = page
+    page_start = 0 if first else 1
+    text = read_page(filename)
+    segment = (u"" if first else u"\n") + text + u"=====#%s#=====" % page_no
+    if last:
+        segment += u"\n"
+    tokens = TokenStore(segment)
+    if last:
+        pending_pagebreak = scan(segment, tokens, len(segment) - 1)
+        add_final_break(tokens, pending_pagebreak)
+        pending_pagebreak = None
+    else:
+        pending_pagebreak = scan(segment, tokens, len(segment))
+    return tokens, pending_pagebreak, page_start, page_start + len(text)
+
+
+def tokenise_pages(pages, jobs=1):
+    """Tokenises the template made up of the page files pages, as returned by page_files. The pages
+    are read and tokenised in a pool of jobs processes if jobs is greater than 1, and the page
+    markers are made from the page numbers of the file names. Returns a TokenStore, whose text is
+    a PagedText, with the same tokens as tokenising the joined template."""
+    items = [(page_no, filename, c == 0, c == len(pages) - 1)
+             for c, (page_no, filename) in enumerate(pages)]
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs)
+        results = pool.imap(scan_page, items, max(1, len(items) // (jobs * 4)))
+    else:
+        pool = None
+        results = map(scan_page, items)
+    text = PagedText()
+    tokens = TokenStore(text)
+    pending_pagebreak = None
+    try:
+        for (page_no, filename, first, last), result in zip(items, results):
+            page_tokens, page_pending, page_start, page_end = result
+            offset = text.add(page_tokens.text, page_no, page_start, page_end)
+            start = len(tokens)
+            tokens.starts.extend([X + offset for X in page_tokens.starts])
+            tokens.ends.extend([X + offset for X in page_tokens.ends])
+            tokens.flags.extend(page_tokens.flags)
+            for c, p in page_tokens.pages.items():
+                tokens.pages[start + c] = p
+            if pool:
+                #word IDs are only meaningful in the process that interned them
+                tokens.word_ids.extend([
+                        vocabulary.intern(page_tokens.token(c)[0].lower())
+                        if page_tokens.flags[c] & WORD_TYPES else NO_WORD
+                        for c in range(len(page_tokens))])
+            else:
+                tokens.word_ids.extend(page_tokens.word_ids)
+            #the marker ending the previous page is a pagebreak on the linebreak that starts this
+            #page's segment, unless the segment starts with another marker
+            if (pending_pagebreak and len(page_tokens) and page_tokens.starts[0] == 0 and
+                page_tokens.flags[0] & TYPE_LINEBREAK):
+                tokens.flags[start] |= TYPE_PAGEBREAK
+                tokens.pages[start] = pending_pagebreak
+            pending_pagebreak = page_pending
+    finally:
+        if pool: pool.terminate()
+    return tokens
+
+
+def read_template(pattern, jobs=1):
+    """Reads a template given as a file name or as page files (see page_files). Returns the text of
+    the file, or a TokenStore of the pages as returned by tokenise_pages, which the processing
+    functions accept in place of the template text."""
+    pages = page_files(pattern)
+    if pages:
+        return tokenise_pages(pages, jobs)
+    return read_text(pattern)
+
+
+def as_tokens(text, jobs=1):
+    """Tokenises text, unless it is already a TokenStore."""
+    if isinstance(text, TokenStore):
+        return text
+    return tokenise(text, jobs)
+
+
+def read_text(filename):
+    """Reads a UTF-8 text file. Line endings are left as they are in the file."""
+    with open(filename, encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def write_text(filename, text):
+    """Writes text to filename as UTF-8, without translating line endings."""
+    with open(filename, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+
+
+def main():
+    """Tokenises each file given on the command line and reports throughput."""
+    if len(sys.argv) < 2:
+        print("Usage: %s file ..." % sys.argv[0])
+        sys.exit(-1)
+    for filename in sys.argv[1:]:
+        text = read_text(filename)
+        start_time = time.time()
+        token_count = len(tokenise(text))
+        elapsed = max(time.time() - start_time, 1e-9)
+        print("%s: %d chars, %d tokens in %.3fs (%d chars/s, %d tokens/s)" % (
+            filename, len(text), token_count, elapsed,
+            len(text) / elapsed, token_count / elapsed))
+
+
+if __name__ == "__main__":
+    main()
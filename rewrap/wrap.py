@@ -0,0 +1,731 @@
+# -*- coding: utf-8 -*-
+
+"""This program takes a template file and an input file, and outputs
+the input file with the page breaks and line breaks from the template
+file.
+
+The program assumes that the paragraphs in the template file and input
+file are in corresponding positions. Use the match_para program to
+acheive this if necessary."""
+
+import sys
+import os
+import io
+import itertools
+import collections
+import time
+import bisect
+from . import align
+from . import tokenise
+from . import stats
+from . import memo
+from .common import dump_tokens, linebreak_to_space
+
+#the most insertions and deletions merge_breaks will spend aligning a shard before falling back to
+#placing its breaks proportionally
+align_budget = 2000
+
+#gaps between anchors of more than this many tokens are divided further by densify_matches
+densify_threshold = 40
+
+#the wrapped paras of the most recently wrapped pairs of paras, and the messages logged wrapping
+#them
+wrap_memo = memo.LRU(1024)
+
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+
+class Logger:
+    """Collects messages about the paragraphs being processed. Messages are of the form
+    "Level: kind", e.g. "Warning: No matches". Messages below the logger's level are discarded
+    before any formatting is done. The rest are formatted for output, or stdout if output is None,
+    and, if report is given, written to it as JSON lines for review tools. Both are buffered and
+    only written when the buffer fills or flush is called. The logger also carries the stats.Stats
+    object that timings and counters are recorded in.
+
+    If recorded is set to a dictionary, every message is also recorded in it, whatever its level,
+    in the form {template_para: [(s, t_shard, i_shard), ...], ...}, so that it can be replayed
+    later with message."""
+
+    def __init__(self, output=None, level="info", report=None, buffer_size=256):
+        self.template_para = None
+        self.input_para = None
+        self.template_line = None
+        self.input_line = None
+        self.output = output
+        self.level = LOG_LEVELS[level]
+        self.report = report
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.report_buffer = []
+        self.stats = stats.Stats()
+        self.recorded = None
+        self.set_texts(None, None)
+
+
+    def set_texts(self, template_tokens, input_tokens):
+        """Set the TokenStores of the texts that para numbers refer to. The line number of each
+        para is only calculated, from the token offsets, once a message needs it."""
+        self.template_tokens = template_tokens
+        self.input_tokens = input_tokens
+        self.template_lines = None
+        self.input_lines = None
+        self.template_first = self.input_first = 0
+
+
+    def set_window(self, template_first, input_first, template_lines, input_lines):
+        """For texts processed a window of paras at a time: set the number of the first template
+        and input para of the window, which para numbers within the window are counted from, and
+        lists of the line numbers of the paras of the window."""
+        self.template_tokens = self.input_tokens = None
+        self.template_lines, self.input_lines = template_lines, input_lines
+        self.template_first, self.input_first = template_first, input_first
+
+
+    def set_current_para(self, template_para, input_para=None, template_line=None, input_line=None):
+        """Set the paras that messages refer to. The line numbers of the paras are looked up unless
+        they are given."""
+        self.template_para = template_para
+        self.input_para = input_para
+        self.template_line, self.input_line = template_line, input_line
+
+
+    def __line(self, para, line, tokens, attr):
+        if line != None: return line
+        lines = getattr(self, attr)
+        if lines == None:
+            if tokens == None: return 99999
+            lines = para_line_numbers(tokens)
+            setattr(self, attr, lines)
+        if para != None and para < len(lines):
+            return lines[para]
+        return 99999
+
+
+    def message(self, s, t_shard=None, i_shard=None):
+        if self.recorded != None:
+            self.recorded.setdefault(self.template_para, []).append(
+                (s, t_shard and [list(X) for X in t_shard] or None,
+                 i_shard and [list(X) for X in i_shard] or None))
+        level, sep, kind = s.partition(": ")
+        level = LOG_LEVELS.get(level.lower(), LOG_LEVELS["info"])
+        if level < self.level: return
+        t_line = self.__line(self.template_para, self.template_line, self.template_tokens,
+                             "template_lines")
+        i_line = self.__line(self.input_para, self.input_line, self.input_tokens, "input_lines")
+        t_para = self.template_para
+        if t_para != None: t_para += self.template_first
+        i_para = self.input_para
+        if i_para != None: i_para += self.input_first
+        t_para_str = ""
+        if t_para != None:
+            t_para_str = " t:%04d(%05d)" % (t_para, t_line)
+        i_para_str = ""
+        if i_para != None :
+            i_para_str = " i:%04d(%05d)" % (i_para, i_line)
+        t_text = dump_tokens(t_shard, True) if t_shard else None
+        i_text = dump_tokens(i_shard, True) if i_shard else None
+        self.buffer.append("[ %s ]\n" % (s + t_para_str + i_para_str))
+        if t_text:
+            self.buffer.append("    t: %s\n" % t_text.replace("\n", "¶"))
+        if i_text:
+            self.buffer.append("    i: %s\n" % i_text.replace("\n", "¶"))
+        if self.report:
+            import json
+            self.report_buffer.append(json.dumps({
+                        "level": [X for X in LOG_LEVELS if LOG_LEVELS[X] == level][0],
+                        "kind": kind or s, "para": t_para, "line": t_line,
+                        "input_para": i_para, "input_line": i_line,
+                        "t_shard": t_text, "i_shard": i_text}) + "\n")
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+
+    def write_raw(self, text, report_text=""):
+        """Adds already formatted output and report lines, such as those collected by another
+        logger, to the buffers."""
+        if text: self.buffer.append(text)
+        if report_text and self.report: self.report_buffer.append(report_text)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+
+    def flush(self):
+        if self.buffer:
+            (self.output or sys.stdout).write("".join(self.buffer))
+            self.buffer = []
+        if self.report_buffer:
+            self.report.write("".join(self.report_buffer))
+            self.report_buffer = []
+
+
+def para_line_numbers(tokens):
+    """Takes a TokenStore and returns a list with the line number of the first line containing text
+    of each of the paragraphs that split_paras splits it into. The line numbers are counted from the
+    token offsets, so the text is not split into lines again."""
+    lines = []
+    text = tokens.text
+    line_no, pos = 1, 0
+    for para in split_paras(tokens):
+        offset = None
+        for c in range(para.start, para.stop):
+            if not tokens.flags[c] & (tokenise.TYPE_SPACE | tokenise.TYPE_LINEBREAK):
+                offset = tokens.starts[c]
+                break
+        if offset == None:
+            offset = tokens.starts[para.start]
+        line_no += text.count("\n", pos, offset)
+        pos = offset
+        lines.append(line_no)
+    return lines
+
+
+def split_paras(tokens):
+    """Split a list of tokens into a list of paragraphs of the form:
+    [[tok1.1, tok1.2...], [tok2.1, tok2.2, ...], ...]
+    The paragraphs are slices of tokens, so if tokens is a TokenStore they are TokenViews and no
+    tokens are copied."""
+    para_list = []
+    start = 0
+    #the flags of a TokenStore are read directly rather than making each token
+    flags = tokens.flags if isinstance(tokens, tokenise.TokenStore) else [X[1] for X in tokens]
+    for c, f in enumerate(flags):
+        if f & tokenise.TYPE_PARABREAK:
+            para_list.append(tokens[start:c + 1])
+            start = c + 1
+    if start < len(tokens):
+        para_list.append(tokens[start:])
+    return para_list
+
+
+def token_dict(ids):
+    """Takes a sequence of word IDs, as returned by tokenise.word_ids, and creates a dictionary
+    with each ID as key and the index of the token as value, or None if the ID is not unique."""
+    token_dict = {}
+    for c, key in enumerate(ids):
+        if key != tokenise.NO_WORD:
+            if key in token_dict:
+                token_dict[key] = None
+            else:
+                token_dict[key] = c
+    return token_dict
+
+
+def build_match_list(t_tokens, i_tokens, t_ids=None, i_ids=None):
+    """Matches the tokens that are unique in both t_tokens and i_tokens. The word IDs of the tokens
+    are looked up with tokenise.word_ids unless they are given."""
+    if t_ids == None: t_ids = tokenise.word_ids(t_tokens)
+    if i_ids == None: i_ids = tokenise.word_ids(i_tokens)
+    matches = []
+    t_token_dict = token_dict(t_ids)
+    i_token_dict = token_dict(i_ids)
+    for c, key in enumerate(t_ids):
+        if t_token_dict.get(key) != None and i_token_dict.get(key) != None:
+            matches.append([c, i_token_dict[key]])
+    #ensure matches monotonically increases in both fields
+    return longest_increasing_matches(matches)
+
+
+def ngram_dict(ids, start, end, n):
+    """Takes a sequence of word IDs, as returned by tokenise.word_ids, and creates a dictionary with
+    each run of n consecutive words of ids[start:end], ignoring the tokens between them, as key and
+    the index of the token starting it as value, or None if the run is not unique."""
+    words = [c for c in range(start, end) if ids[c] != tokenise.NO_WORD]
+    ngrams = {}
+    for c in range(len(words) - n + 1):
+        key = tuple([ids[X] for X in words[c:c + n]])
+        ngrams[key] = None if key in ngrams else words[c]
+    return ngrams
+
+
+def densify_matches(matches, t_ids, i_ids):
+    """Adds anchors to the matches found by build_match_list where they are far apart. Words that
+    are unique in a whole paragraph are scarce in long paragraphs of common words, leaving long
+    shards for merge_breaks to align. Each gap between matches of more than densify_threshold
+    tokens is searched for words, then pairs of words, then triples of words, that are unique
+    within the gap in both token lists, and the longest increasing chain of the first of these
+    found is added. The gaps between the new anchors are then divided the same way. Returns the
+    new match list."""
+    matches = list(matches)
+    stack = [(s[0] + 1, e[0], s[1] + 1, e[1]) for s, e in
+             zip([[-1, -1]] + matches, matches + [[len(t_ids), len(i_ids)]])]
+    while stack:
+        t_start, t_end, i_start, i_end = stack.pop()
+        if max(t_end - t_start, i_end - i_start) <= densify_threshold: continue
+        for n in 1, 2, 3:
+            t_ngrams = ngram_dict(t_ids, t_start, t_end, n)
+            i_ngrams = ngram_dict(i_ids, i_start, i_end, n)
+            found = [[t_ngrams[k], i_ngrams[k]] for k in t_ngrams
+                     if t_ngrams[k] != None and i_ngrams.get(k) != None]
+            if found: break
+        if not found: continue
+        found.sort()
+        chain = longest_increasing_matches(found)
+        matches += chain
+        for s, e in zip([[t_start - 1, i_start - 1]] + chain, chain + [[t_end, i_end]]):
+            stack.append((s[0] + 1, e[0], s[1] + 1, e[1]))
+    matches.sort()
+    return matches
+
+
+def longest_increasing_matches(matches):
+    """Takes a list of matches of the form [[t_index, i_index], ...], sorted by t_index and with
+    no repeated i_index, and returns the longest subsequence in which i_index also increases. Uses
+    patience sorting, so is O(n log n) in the number of matches."""
+    tails = [] #i_index of the smallest tail of each increasing run length
+    tail_pos = [] #position in matches of that tail
+    prev = [None] * len(matches)
+    for c, m in enumerate(matches):
+        run_len = bisect.bisect_left(tails, m[1])
+        if run_len:
+            prev[c] = tail_pos[run_len - 1]
+        if run_len == len(tails):
+            tails.append(m[1])
+            tail_pos.append(c)
+        else:
+            tails[run_len] = m[1]
+            tail_pos[run_len] = c
+    chain = []
+    c = tail_pos[-1] if tail_pos else None
+    while c != None:
+        chain.append(matches[c])
+        c = prev[c]
+    chain.reverse()
+    return chain
+
+
+def place_breaks_proportionally(t_shard, i_shard):
+    """Cheap fallback for shards that are too dissimilar to align. Each linebreak of t_shard is
+    placed on the space of i_shard nearest to the same proportion of the way through it."""
+    spaces = [c for c, t in enumerate(i_shard) if t[1] & tokenise.TYPE_SPACE]
+    for ct, t in enumerate(t_shard):
+        if t[1] & tokenise.TYPE_LINEBREAK and spaces:
+            target = ct * len(i_shard) // len(t_shard)
+            c = bisect.bisect_left(spaces, target)
+            if c == len(spaces) or (c and target - spaces[c - 1] <= spaces[c] - target):
+                c -= 1
+            i_shard[spaces[c]] = t
+            del spaces[c]
+    return i_shard
+
+
+def merge_breaks(t_shard, i_shard, logger):
+    #if there are no line breaks in the shard, just return the i_shard
+    if not [X for X in t_shard if X[1] & tokenise.TYPE_LINEBREAK]:
+        return i_shard
+    #so, there are some linebreaks...
+    nt_shard = t_shard[:]
+    linebreak_to_space(nt_shard)
+    if i_shard == nt_shard:
+        #simple case -- identical shards if you replace the linebreaks with spaces
+        for c, t in enumerate(t_shard):
+            if t[1] & tokenise.TYPE_LINEBREAK:
+                i_shard[c] = t
+    else:
+        #bring in the big guns!
+        #intern the tokens of the shards so that the aligner only compares ints
+        shard_vocabulary = {}
+        nt_seq = [shard_vocabulary.setdefault(tuple(X), len(shard_vocabulary)) for X in nt_shard]
+        i_seq = [shard_vocabulary.setdefault(tuple(X), len(shard_vocabulary)) for X in i_shard]
+        logger.stats.count("align_calls")
+        logger.stats.record("align_shard_length", len(nt_seq) + len(i_seq))
+        try:
+            with logger.stats.phase("align"):
+                mb = align.matching_blocks(nt_seq, i_seq, align_budget)
+        except align.BudgetExceeded:
+            logger.stats.count("align_budget_exceeded")
+            logger.message("Warning: Alignment budget exceeded, placing breaks proportionally",
+                           t_shard, i_shard)
+            return place_breaks_proportionally(t_shard, i_shard)
+        if len(mb) == 1:
+            #no match in shards
+            logger.message("Warning: No matches", t_shard, i_shard)
+            return i_shard
+        for ct, t in enumerate(t_shard):
+            if t[1] & tokenise.TYPE_LINEBREAK:
+                #find the match block after the linebreak
+                for cm, m in enumerate(mb):
+                    if m[0] > ct: break
+                if cm == 0:
+                    if ct == 0 and (i_shard[0][1] & tokenise.TYPE_SPACE):
+                        i_shard[0] = t
+                    else:
+                        logger.message("Warning: No candidate space", t_shard, i_shard)
+                elif mb[cm - 1][0] + mb[cm - 1][2] > ct:
+                    #break occured inside prev matchblock
+                    i_shard[ct + mb[cm - 1][1] - mb[cm - 1][0]] = t
+                elif mb[cm][0] - 1 == ct:
+                    #break occurred just prior to matchblock
+                    candidate = mb[cm][1] - 1
+                    if i_shard[candidate][1] & tokenise.TYPE_SPACE:
+                        i_shard[candidate] = t
+                    elif i_shard[candidate][0] == "-":
+                        #line is broken at hyphen
+                        i_shard[candidate] = t
+                        i_shard[candidate][0] = "-" + i_shard[candidate][0]
+                    else:
+                        logger.message("Warning: No candidate space", t_shard, i_shard)
+                else:
+                    #match occurred outside matchblock
+                    logger.message("Warning: Break outside match block", t_shard, i_shard)
+    return i_shard
+
+
+def wrap_para(t_para, i_para, logger):
+    t_tokens, i_tokens = list(t_para), list(i_para)
+    o_tokens = []
+    linebreak_to_space(i_tokens)
+    t_ids, i_ids = tokenise.word_ids(t_para), tokenise.word_ids(i_para)
+    matches = build_match_list(t_tokens, i_tokens, t_ids, i_ids)
+    anchor_count = len(matches)
+    matches = densify_matches(matches, t_ids, i_ids)
+    logger.stats.count("densify_anchors", len(matches) - anchor_count)
+    #handle shards before first match
+    if not matches: return list(i_para)
+    t_shard = t_tokens[:matches[0][0]]
+    i_shard = i_tokens[:matches[0][1]]
+    if t_shard or i_shard:
+        i_shard = i_tokens[0:matches[0][1]]
+        o_tokens = merge_breaks(t_shard, i_shard, logger)
+    for start, end in zip(matches, matches[1:] + [[len(t_tokens), len(i_tokens)]]):
+        o_tokens.append(i_tokens[start[1]])
+        t_shard = t_tokens[start[0] + 1:end[0]]
+        if t_shard:
+            i_shard = i_tokens[start[1] + 1:end[1]]
+            o_tokens += merge_breaks(t_shard, i_shard, logger)
+    if o_tokens[-1][1] & tokenise.TYPE_SPACE:
+        logger.message("Warning: Additional material after final linebreak", t_shard, i_shard)
+        o_tokens[-1] = ("\n", tokenise.TYPE_LINEBREAK | tokenise.TYPE_PARABREAK)
+    return o_tokens
+
+
+def memo_wrap_para(t_para, i_para, logger):
+    """Wraps i_para with wrap_para and returns it as a string. If the paras are the same once their
+    linebreaks are made spaces, the breaks of t_para are transferred directly. Otherwise the result,
+    along with the messages logged while wrapping, is kept in wrap_memo and is reused, and the
+    messages logged again, when the same pair of paras is wrapped again, as a repeated heading or
+    scene break would be."""
+    t_tokens, i_tokens = list(t_para), list(i_para)
+    nt_tokens, ni_tokens = t_tokens[:], i_tokens[:]
+    linebreak_to_space(nt_tokens)
+    linebreak_to_space(ni_tokens)
+    if nt_tokens == ni_tokens:
+        logger.stats.count("fast_path_paras")
+        return para_string(t_tokens)
+    #the key covers the linebreaks of i_para, since wrap_para returns it as it is if it finds no
+    #matches
+    key = memo.tokens_key(t_tokens, i_tokens)
+    entry = wrap_memo.get(key)
+    if entry:
+        logger.stats.count("wrap_memo_hits")
+        wrapped, messages = entry
+        for s, t_shard, i_shard in messages:
+            logger.message(s, t_shard, i_shard)
+        return wrapped
+    logger.stats.count("wrap_memo_misses")
+    recorded, logger.recorded = logger.recorded, {}
+    try:
+        wrapped = para_string(wrap_para(t_para, i_para, logger))
+        messages = logger.recorded.get(logger.template_para, [])
+    finally:
+        logger.recorded = recorded
+    if recorded != None:
+        recorded.setdefault(logger.template_para, []).extend(messages)
+    wrap_memo.put(key, (wrapped, messages))
+    return wrapped
+
+
+def para_string(tokens):
+    outstr = []
+    for t in tokens:
+        outstr.append(t[0])
+        if (t[1] & tokenise.TYPE_PAGEBREAK) and len(t) == 3:
+            outstr.append(u"=====#%s#=====\n" % t[2])
+    return "".join(outstr)
+
+
+def build_output(wrapped_paras):
+    return "\n".join([para_string(p) for p in wrapped_paras if p])
+
+
+def read_paras(filename):
+    """Generator that reads filename, or the page files it names (see tokenise.page_files), a chunk
+    at a time and yields its paragraphs in the form (line_no, para), where line_no is the line
+    number of the first line of para containing text. Only the chunk being processed is held in
+    memory."""
+    pages = tokenise.page_files(filename)
+    f = tokenise.page_lines(pages) if pages else open(filename, encoding="utf-8", newline="")
+    for line_no, tokens in tokenise.tokenise_chunks(f):
+        for para, para_line in zip(split_paras(tokens), para_line_numbers(tokens)):
+            yield line_no + para_line - 1, para
+    f.close()
+
+
+def wrap_pair(pair, logger):
+    """Wraps one pair of paras of the form (para_no, t_line, i_line, t_para, i_para), where the
+    line numbers may be None if unknown. Returns the wrapped para as a string."""
+    c, t_line, i_line, t_para, i_para = pair
+    logger.set_current_para(c, c, t_line, i_line)
+    start_time = time.time()
+    with logger.stats.phase("wrap_para"):
+        if t_para != i_para:
+            wrapped = memo_wrap_para(t_para, i_para, logger)
+        else:
+            logger.stats.count("identical_paras")
+            wrapped = para_string(i_para)
+    logger.stats.para_time(time.time() - start_time, "t:%04d(%05d)" % (
+            c, t_line if t_line != None else 99999))
+    return wrapped
+
+
+def wrap_batch(batch, level="info", report=False, record=False):
+    """Process pool worker. Wraps a list of para pairs, as taken by wrap_pair, and returns a
+    tuple of the form
+    ([wrapped_para_string, ...], logger_output, logger_report, stats_dict, recorded), where
+    recorded is the logger's recorded messages if record is True and None otherwise."""
+    output = io.StringIO()
+    report_output = io.StringIO() if report else None
+    logger = Logger(output, level, report_output)
+    if record: logger.recorded = {}
+    wrapped = [wrap_pair(X, logger) for X in batch]
+    logger.flush()
+    return (wrapped, output.getvalue(), report_output.getvalue() if report else "",
+            logger.stats.as_dict(), logger.recorded)
+
+
+def wrap_pairs(pairs, logger, jobs=1, batch_size=64):
+    """Generator that wraps each para pair in the iterable pairs, as taken by wrap_pair, and
+    yields the wrapped paras as strings in order. If jobs is greater than 1, batches of
+    batch_size pairs are wrapped in a pool of jobs processes. The messages of each batch are
+    collected by the worker and written to logger's output in para order, and no more than
+    2 * jobs batches are in progress at any one time."""
+    if jobs <= 1:
+        for pair in pairs:
+            yield wrap_pair(pair, logger)
+        return
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs)
+    pending = collections.deque()
+    def submit(batch):
+        #TokenViews are copied to lists so that only the para, not its whole store, is pickled
+        batch = [(c, t_line, i_line, list(t_para), list(i_para))
+                 for c, t_line, i_line, t_para, i_para in batch]
+        level = [X for X in LOG_LEVELS if LOG_LEVELS[X] == logger.level][0]
+        pending.append(pool.apply_async(wrap_batch, (batch, level, bool(logger.report),
+                                                     logger.recorded != None)))
+    def collect():
+        wrapped, log, report, stats_dict, recorded = pending.popleft().get()
+        logger.write_raw(log, report)
+        logger.stats.merge(stats_dict)
+        if recorded: logger.recorded.update(recorded)
+        return wrapped
+    try:
+        batch = []
+        for pair in pairs:
+            batch.append(pair)
+            if len(batch) == batch_size:
+                submit(batch)
+                batch = []
+                if len(pending) >= 2 * jobs:
+                    for s in collect(): yield s
+        if batch:
+            submit(batch)
+        while pending:
+            for s in collect(): yield s
+    finally:
+        pool.terminate()
+
+
+def stream_wrap(t_filename, i_filename, outfile, jobs=1, logger=None):
+    """Wraps the paragraphs of i_filename using the paragraphs of t_filename a pair at a time,
+    writing each to outfile as soon as it is wrapped, so that memory use is bounded by the largest
+    paragraph rather than the size of the files. Returns a tuple of the form
+    (template_para_count, input_para_count)."""
+    counts = [0, 0]
+    def pairs():
+        for t_item, i_item in itertools.zip_longest(read_paras(t_filename),
+                                                      read_paras(i_filename)):
+            if t_item: counts[0] += 1
+            if i_item: counts[1] += 1
+            #once the para counts differ, only counting continues
+            if counts[0] != counts[1]: continue
+            logger.stats.count("template_tokens", len(t_item[1]))
+            logger.stats.count("input_tokens", len(i_item[1]))
+            yield (counts[0] - 1, t_item[0], i_item[0], t_item[1], i_item[1])
+    if logger == None: logger = Logger()
+    logger.set_texts(None, None)
+    with logger.stats.phase("wrap"):
+        for c, s in enumerate(wrap_pairs(pairs(), logger, jobs)):
+            if c:
+                outfile.write("\n")
+            outfile.write(s)
+    logger.flush()
+    logger.stats.count("template_paras", counts[0])
+    logger.stats.count("input_paras", counts[1])
+    return tuple(counts)
+
+
+def page_range_paras(tokens, para_list, first_page, last_page):
+    """Finds the paras of para_list, as split from the TokenStore tokens, that have text on pages
+    first_page to last_page, using the page index of the text of tokens. Returns a tuple of the form
+    (start, stop), such that para_list[start:stop] are the paras. Raises ValueError if either page
+    has no marker in the text."""
+    index = tokenise.page_index(tokens.text)
+    offsets = dict([(int(X[0]), X) for X in index])
+    for page in first_page, last_page:
+        if page not in offsets:
+            raise ValueError("Page %d not found" % page)
+    span_start, span_end = offsets[first_page][1], offsets[last_page][2]
+    start, stop = None, 0
+    for c, para in enumerate(para_list):
+        text_offsets = [tokens.starts[X] for X in range(para.start, para.stop)
+                        if not tokens.flags[X] & (tokenise.TYPE_SPACE | tokenise.TYPE_LINEBREAK)]
+        if not text_offsets: continue
+        if text_offsets[0] >= span_end: break
+        if text_offsets[-1] >= span_start:
+            if start == None: start = c
+            stop = c + 1
+    if start == None:
+        start = stop
+    return start, stop
+
+
+def wrap_strings(t_string, i_string, logger=None, jobs=1, pages=None):
+    """Wraps i_string using the template t_string, which may also be a TokenStore as returned by
+    tokenise.read_template. Large texts are tokenised, and paras wrapped, in a pool of jobs
+    processes. Messages are written to logger, or a Logger writing to stdout if it is None. If
+    pages is given, in the form (first_page, last_page), only the paras with text on those
+    pages of the template are wrapped (see page_range_paras). Returns a tuple of the form
+    (wrapped_string, template_para_count, input_para_count). If the counts differ, nothing is
+    wrapped and wrapped_string is None."""
+    if logger == None: logger = Logger()
+    #process template into para list
+    with logger.stats.phase("tokenise"):
+        t_tokens = tokenise.as_tokens(t_string, jobs)
+        t_para_list = split_paras(t_tokens)
+    #process input into para list
+    with logger.stats.phase("tokenise"):
+        i_tokens = tokenise.tokenise(i_string, jobs)
+        i_para_list = split_paras(i_tokens)
+    logger.stats.count_texts(t_tokens, i_tokens, t_para_list, i_para_list)
+    #sanity check -- must be the same number of paras in template and input
+    if len(t_para_list) != len(i_para_list):
+        return None, len(t_para_list), len(i_para_list)
+    logger.set_texts(t_tokens, i_tokens)
+    start, stop = 0, len(t_para_list)
+    if pages:
+        start, stop = page_range_paras(t_tokens, t_para_list, pages[0], pages[1])
+    t_lines, i_lines = para_line_numbers(t_tokens), para_line_numbers(i_tokens)
+    pairs = [(c, t_lines[c], i_lines[c], t_para_list[c], i_para_list[c])
+             for c in range(start, stop)]
+    with logger.stats.phase("wrap"):
+        wrapped_paras = list(wrap_pairs(pairs, logger, jobs))
+    logger.flush()
+    return "\n".join(wrapped_paras), len(t_para_list), len(i_para_list)
+
+
+def wrap_files(t_filename, i_filename, jobs=1, stream=False, logger=None, pages=None,
+               cache_dir=None):
+    """Wraps input file i_filename using the template t_filename, a file or page files as taken by
+    tokenise.read_template, whose pages are read in a pool of jobs processes. The result is written
+    to a file with the same name as the input file with ".wrap" appended. Messages are written to
+    logger, or a Logger writing to stdout if it is None. If pages is given, in the form
+    (first_page, last_page), only the paras on those pages are wrapped and the output file name has
+    ".first_page-last_page.wrap" appended instead. Returns a tuple of the form
+    (template_para_count, input_para_count). If the counts differ, no output is written, or if
+    stream is True, only the paragraphs before the counts were found to differ. Unless stream is
+    True, if cache_dir is given, the tokenised template is kept there in a book file (see
+    bookfile)."""
+    if logger == None: logger = Logger()
+    if stream:
+        with open(i_filename + ".wrap", "w", encoding="utf-8", newline="") as outfile:
+            return stream_wrap(t_filename, i_filename, outfile, jobs, logger)
+    if cache_dir:
+        from . import bookfile
+        t_string = bookfile.read_template(t_filename, cache_dir, jobs, logger.stats)[0]
+    else:
+        t_string = tokenise.read_template(t_filename, jobs)
+    wrapped_string, t_count, i_count = wrap_strings(
+        t_string, tokenise.read_text(i_filename), logger, jobs, pages)
+    if wrapped_string != None:
+        suffix = ".%d-%d.wrap" % pages if pages else ".wrap"
+        tokenise.write_text(i_filename + suffix, wrapped_string)
+    return t_count, i_count
+
+
+def page_range(s):
+    """Parses a page range argument of the form "A-B" or "A" into a tuple (A, B)."""
+    first, sep, last = s.partition("-")
+    try:
+        first = int(first)
+        last = int(last) if sep else first
+    except ValueError:
+        raise ValueError("page range must be of the form A-B")
+    if last < first:
+        raise ValueError("page range must be of the form A-B, with A <= B")
+    return first, last
+
+
+def template_exists(t_filename):
+    """True if t_filename is a template file or names page files (see tokenise.page_files)."""
+    return os.path.isfile(t_filename) or bool(tokenise.page_files(t_filename))
+
+
+def add_logging_arguments(parser):
+    parser.add_argument("--log-level", choices=["debug", "info", "warning", "error"],
+                        default="info", help="only report messages of at least this level")
+    parser.add_argument("--report", metavar="FILE",
+                        help="also write messages to FILE as JSON lines")
+    parser.add_argument("--stats", action="store_true",
+                        help="print timings and counters for each phase when done")
+
+
+def logger_from_arguments(args):
+    report = open(args.report, "w", encoding="utf-8") if args.report else None
+    return Logger(level=args.log_level, report=report)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(usage="%(prog)s [--stream] [--jobs N] [--pages A-B] "
+                                     "[--cache DIR] [--log-level LEVEL] [--report FILE] [--stats] "
+                                     "template_file input_file")
+    parser.add_argument("template_file",
+                        help="template file, or directory or glob pattern of template page files")
+    parser.add_argument("input_file")
+    parser.add_argument("--stream", action="store_true",
+                        help="wrap and write one paragraph at a time, so that memory use is "
+                        "bounded by the largest paragraph; only empty lines separate paragraphs, "
+                        "so lines holding spaces or CRLF line ends do not")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                        help="read template page files, tokenise large texts and wrap "
+                        "paragraphs in a pool of N processes")
+    parser.add_argument("--pages", type=page_range, metavar="A-B",
+                        help="only wrap the paragraphs on template pages A to B, writing them to "
+                        "input_file.A-B.wrap")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="keep the tokenised template in DIR")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    if not template_exists(args.template_file) or not os.path.isfile(args.input_file):
+        print("Usage: %s template_file input_file" % sys.argv[0])
+        sys.exit(-1)
+    if args.pages and args.stream:
+        parser.error("--pages cannot be used with --stream")
+    logger = logger_from_arguments(args)
+    try:
+        t_count, i_count = wrap_files(args.template_file, args.input_file, args.jobs,
+                                      args.stream, logger, args.pages, args.cache)
+    except ValueError as e:
+        print(e)
+        sys.exit(-3)
+    #sanity check -- must be the same number of paras in template and input
+    if t_count != i_count:
+        print("Number of paragraphs\n template: %s\n input: %s" % (t_count, i_count))
+        sys.exit(-2)
+    if args.stats:
+        sys.stdout.write(logger.stats.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,14 @@
-#!/usr/bin/python
-
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 import sys
-import re
+from rewrap import tokenise
 
 #usage split_file file
+#writes the text of each page of file to a file named by its page number
 
 if len(sys.argv) != 2:
-    print "Usage: ", sys.argv[0], "filename"
+    print("Usage: ", sys.argv[0], "filename")
     sys.exit()
-regexp = re.compile("""=====#(\d+)#=====""")
-outstr = ""
-for line in file(sys.argv[1]):
-    mo = regexp.match(line)
-    if mo:
-        outfile = open(mo.group(1), "w")
-        outfile.write(outstr)
-        outfile.close()
-        outstr = ""
-    else:
-        outstr += line
-
-
+text = tokenise.read_text(sys.argv[1])
+for page_no, start, end in tokenise.page_index(text):
+    tokenise.write_text(page_no, text[start:end])
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for bookfile. Run from the top directory with:
+    python3 -m unittest discover -s tests"""
+
+import shutil
+import tempfile
+import unittest
+from rewrap import bookfile
+
+
+text = u"The first para, of several words.\n\nThe second para; it is café talk.\n"
+
+
+class DamagedBookTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.key = bookfile.content_hash(text)
+        self.filename = bookfile.book_filename(self.directory, self.key)
+        bookfile.template_book(text, cache_dir=self.directory)
+        with open(self.filename, "rb") as f:
+            self.data = bytearray(f.read())
+        self.fields = bookfile.header.unpack_from(self.data)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def section(self, name):
+        """The offset and length of the section name."""
+        c = [X[0] for X in bookfile.sections].index(name)
+        return self.fields[5 + 2 * c:7 + 2 * c]
+
+
+    def load_damaged(self):
+        with open(self.filename, "wb") as f:
+            f.write(self.data)
+        return bookfile.load(self.filename, self.key)
+
+
+    def test_intact(self):
+        tokens, para_list = bookfile.load(self.filename, self.key)
+        self.assertEqual(tokens.text[0:len(tokens.text)], text)
+        self.assertEqual(len(para_list), 2)
+
+
+    def test_bad_text(self):
+        offset, length = self.section("text")
+        self.data[offset + length - 3] = 0xff
+        self.assertEqual(self.load_damaged(), None)
+
+
+    def test_bad_array(self):
+        #a flipped bit in an array still decodes, so only the checksum catches it
+        offset, length = self.section("flags")
+        self.data[offset] ^= 1
+        self.assertEqual(self.load_damaged(), None)
+
+
+    def test_bad_section_length(self):
+        #the starts array is cut short of a whole item
+        c = [X[0] for X in bookfile.sections].index("starts")
+        fields = list(self.fields)
+        fields[6 + 2 * c] -= 1
+        bookfile.header.pack_into(self.data, 0, *fields)
+        self.assertEqual(self.load_damaged(), None)
+
+
+    def test_truncated(self):
+        del self.data[len(self.data) // 2:]
+        self.assertEqual(self.load_damaged(), None)
+        del self.data[bookfile.header.size // 2:]
+        self.assertEqual(self.load_damaged(), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
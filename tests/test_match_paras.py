@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for match_paras. Run from the top directory with:
+    python3 -m unittest discover -s tests"""
+
+import random
+import unittest
+from rewrap import tokenise
+from rewrap import match_paras
+
+
+common_words = ("the of and to a in that it was he i his you with as had for her my at on not "
+                "be is by which have from this but all so me were they she").split()
+
+
+def letters(n):
+    """n written in letters, so that it is tokenised as a single word."""
+    s = ""
+    while True:
+        n, r = divmod(n, 26)
+        s += chr(ord("a") + r)
+        if not n: return s
+
+
+#a vocabulary whose words are used with the frequencies of the words of an English text, the
+#commonest so often that they are in nearly every para
+vocabulary = common_words + ["w" + letters(X) for X in range(5000)]
+weights = [1.0 / (X + 1) for X in range(len(vocabulary))]
+
+
+def common_word_paras(count, rng):
+    """Text of count paras of words drawn at random from vocabulary."""
+    paras = []
+    for c in range(count):
+        words = rng.choices(vocabulary, weights, k=rng.randint(10, 80))
+        paras.append(" ".join(words))
+    return "\n\n".join(paras) + "\n"
+
+
+class FuzzyCandidatesTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(1)
+        self.t_paras = match_paras.split_and_sign_paras(
+            tokenise.tokenise(common_word_paras(300, rng)))
+        self.i_paras = match_paras.split_and_sign_paras(
+            tokenise.tokenise(common_word_paras(300, rng)))
+
+
+    def test_candidate_count(self):
+        #nearly every pair of paras shares a common word, but the rare words of their prefixes
+        #keep all but a few pairs from being scored
+        pairs = len(self.t_paras) * len(self.i_paras)
+        sharing = len([1 for pt in self.t_paras for pi in self.i_paras if pt[0] & pi[0]])
+        self.assertGreater(sharing, pairs * 9 // 10)
+        candidates = list(match_paras.fuzzy_candidates(self.t_paras, self.i_paras))
+        self.assertLess(len(candidates), pairs // 50)
+
+
+    def test_no_match_missed(self):
+        candidates = set(match_paras.fuzzy_candidates(self.t_paras, self.i_paras))
+        for ct, pt in enumerate(self.t_paras):
+            for ci, pi in enumerate(self.i_paras):
+                if match_paras.fuzzy_match_p(pt[0], pi[0], len(pt[0] & pi[0])):
+                    self.assertIn((ct, ci), candidates)
+
+
+    def test_small_para_in_large(self):
+        #a short para contained in a long one is a candidate either way round, as joins and splits
+        #are built from them
+        short = match_paras.split_and_sign_paras(tokenise.tokenise("the zebra and the yak\n"))
+        long = match_paras.split_and_sign_paras(tokenise.tokenise(
+            "of the zebra and a yak " + " ".join(common_words) + "\n"))
+        self.assertEqual(list(match_paras.fuzzy_candidates(short, long)), [(0, 0)])
+        self.assertEqual(list(match_paras.fuzzy_candidates(long, short)), [(0, 0)])
+
+
+def signed_paras(*paras):
+    return match_paras.split_and_sign_paras(tokenise.tokenise("\n\n".join(paras) + "\n"))
+
+
+class BuildMatchListTest(unittest.TestCase):
+
+    def test_repeated_para_stays_in_gap(self):
+        #the input has lost the first of three scene breaks; the other two are paired with those
+        #in their own gap rather than the first one, across the anchor
+        t_paras = signed_paras("Alpha came first of all.", "Break.",
+                               "The anchor para that divides the book.", "Break.", "Break.",
+                               "Beta came last of all.")
+        i_paras = signed_paras("Alpha came first of all.",
+                               "The anchor para that divides the book.", "Break.", "Break.",
+                               "Beta came last of all.")
+        matches = match_paras.build_match_list(t_paras, i_paras)
+        self.assertEqual([X[:2] for X in matches], [[[0], [0]], [[2], [1]], [[3], [2]],
+                                                    [[4], [3]], [[5], [4]]])
+
+
+    def test_moved_para_found(self):
+        t_paras = signed_paras("Alpha came first of all.", "The para that is moved.",
+                               "The anchor para that divides the book.",
+                               "Beta came last of all.")
+        i_paras = signed_paras("Alpha came first of all.",
+                               "The anchor para that divides the book.",
+                               "Beta came last of all.", "The para that is moved.")
+        matches = match_paras.build_match_list(t_paras, i_paras)
+        self.assertIn([[1], [3]], [X[:2] for X in matches])
+
+
+if __name__ == "__main__":
+    unittest.main()
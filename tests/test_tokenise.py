@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for tokenise. Run from the top directory with:
+    python3 -m unittest discover -s tests"""
+
+import unittest
+from rewrap import tokenise
+
+
+def token_list(chunks):
+    """The tokens of the chunks yielded by tokenise.tokenise_chunks, with offsets in the whole
+    text, in the form [(start, end, flags), ...]"""
+    tokens = []
+    offset = 0
+    for line_no, chunk in chunks:
+        tokens += [(X + offset, Y + offset, Z) for X, Y, Z in
+                   zip(chunk.starts, chunk.ends, chunk.flags)]
+        offset += len(chunk.text)
+    return tokens
+
+
+class TokeniseChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.limit = tokenise.stream_chunk_limit
+
+
+    def tearDown(self):
+        tokenise.stream_chunk_limit = self.limit
+
+
+    def check(self, text):
+        """Tokenises text in chunks, checks that the tokens are those of tokenise and returns the
+        number of chunks."""
+        chunks = list(tokenise.tokenise_chunks(text.splitlines(True)))
+        whole = tokenise.tokenise(text)
+        self.assertEqual(token_list(chunks), list(zip(whole.starts, whole.ends, whole.flags)))
+        return len(chunks)
+
+
+    def test_note_across_paras(self):
+        text = u"A para [** with a note\n\nthat spans] two paras.\n\nAnother para.\n"
+        self.assertEqual(self.check(text), 2)
+
+
+    def test_note_closed_by_pagebreak(self):
+        #a note cannot contain a pagebreak, so the unclosed note does not prevent later cuts
+        text = u"A para [** unclosed\n=====#001#=====\n\n" + u"Another para.\n\n" * 3
+        self.assertEqual(self.check(text), 4)
+
+
+    def test_unclosed_note_limit(self):
+        text = u"A para [** unclosed\n\n" + u"Another para.\n\n" * 10
+        self.assertEqual(self.check(text), 1)
+        tokenise.stream_chunk_limit = 40
+        self.assertTrue(self.check(text) > 1)
+
+
+if __name__ == "__main__":
+    unittest.main()